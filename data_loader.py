@@ -0,0 +1,136 @@
+import itertools
+import logging
+import os
+
+import numpy as np
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+logger = logging.getLogger(__name__)
+
+# Number of lines parsed at the time by the fallback ASCII parser
+ASCII_CHUNK_LINES = 2**18
+
+
+def load_columns(file_path, columns, npz_key=None):
+    """Return the requested columns of the data in ``file_path``.
+
+    ``.npy`` files are memory-mapped, so the columns are read from disk only
+    when they are used. ``.npz`` files can contain multiple arrays, the one to
+    use is ``npz_key`` (it can be omitted if there is only one). Any other
+    file is parsed as whitespace separated ASCII columns (e.g., the output of
+    CarpetIOASCII) and only the requested columns are kept. The parsed columns
+    are cached in a binary file next to the original one, so that they are
+    loaded instantly the next time.
+
+    :param file_path: Path of the file to read.
+    :type file_path: str
+    :param columns: Indices of the columns to return.
+    :type columns: list of int
+    :param npz_key: Name of the array to read in ``.npz`` files.
+    :type npz_key: str or None
+
+    :returns: One 1D array per requested column.
+    :rtype: list of 1D NumPy arrays
+    """
+    file_extension = os.path.splitext(file_path)[1]
+
+    if file_extension == ".npy":
+        data = np.load(file_path, mmap_mode="r")
+        return [data[:, column] for column in columns]
+
+    if file_extension == ".npz":
+        data = load_npz_array(file_path, npz_key)
+        return [data[:, column] for column in columns]
+
+    unique_columns = sorted(set(columns))
+    data = load_ascii_columns(file_path, unique_columns)
+    return [data[:, unique_columns.index(column)] for column in columns]
+
+
+def load_npz_array(file_path, npz_key=None):
+    """Return the array ``npz_key`` from the ``.npz`` file ``file_path``.
+
+    If ``npz_key`` is None, the file has to contain only one array.
+    """
+    with np.load(file_path) as npz_file:
+        keys = list(npz_file.keys())
+        if npz_key is None:
+            if len(keys) != 1:
+                raise ValueError(
+                    f"{file_path} contains the arrays {keys}, choose one with"
+                    " --npz-key"
+                )
+            npz_key = keys[0]
+        if npz_key not in keys:
+            raise ValueError(f"{npz_key} not in {file_path} (available: {keys})")
+        return npz_file[npz_key]
+
+
+def ascii_cache_path(file_path, columns):
+    """Return the path of the binary cache of the given columns of the ASCII
+    file ``file_path``."""
+    directory, filename = os.path.split(file_path)
+    columns_str = "-".join(str(column) for column in columns)
+    return os.path.join(directory, f".{filename}.cols{columns_str}.npy")
+
+
+def load_ascii_columns(file_path, columns):
+    """Return the given columns of the ASCII file ``file_path`` as a 2D array.
+
+    The result is cached in a binary file, which is used as long as it is
+    newer than ``file_path``.
+    """
+    cache_path = ascii_cache_path(file_path, columns)
+
+    if os.path.exists(cache_path) and os.path.getmtime(
+        cache_path
+    ) >= os.path.getmtime(file_path):
+        logger.debug(f"Reading cached columns from {cache_path}")
+        return np.load(cache_path, mmap_mode="r")
+
+    data = parse_ascii_columns(file_path, columns)
+
+    try:
+        np.save(cache_path, data)
+    except OSError as exce:
+        # The directory may not be writable, we can live without the cache
+        logger.debug(f"Could not write cache {cache_path}: {exce}")
+
+    return data
+
+
+def parse_ascii_columns(file_path, columns):
+    """Parse the given columns of the ASCII file ``file_path``.
+
+    Lines starting with # are ignored. When pandas is available, we use its C
+    parser, otherwise we parse the file in chunks of ``ASCII_CHUNK_LINES``
+    lines with NumPy. In both cases, only the requested columns are kept in
+    memory.
+    """
+    if pd is not None:
+        return pd.read_csv(
+            file_path,
+            sep=r"\s+",
+            comment="#",
+            header=None,
+            usecols=columns,
+            dtype=np.float64,
+        )[columns].to_numpy()
+
+    chunks = []
+    with open(file_path) as file_:
+        while True:
+            lines = list(itertools.islice(file_, ASCII_CHUNK_LINES))
+            if not lines:
+                break
+            chunk = np.loadtxt(lines, usecols=columns, comments="#", ndmin=2)
+            if len(chunk) > 0:
+                chunks.append(chunk)
+
+    if not chunks:
+        return np.zeros((0, len(columns)))
+    return np.concatenate(chunks)
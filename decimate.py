@@ -0,0 +1,116 @@
+import numpy as np
+from kuibit.timeseries import TimeSeries
+
+# Default number of buckets: no decimation. Decimation has to be requested,
+# because it changes what is plotted (e.g., markers). Each bucket
+# contributes two points, so 2000 buckets are about twice the number of
+# horizontal pixels of a 10 inch figure at 100 dpi.
+DEFAULT_BUCKETS = 0
+
+
+def minmax_indices(y, num_buckets):
+    """Return the sorted indices of the points of ``y`` to keep so that the
+    plot looks the same.
+
+    ``y`` is divided into ``num_buckets`` buckets with the same number of
+    points, and we keep the minimum and the maximum of each bucket, together
+    with the first and last point. For data sampled uniformly (as the output
+    of a simulation), each bucket covers the same width in the plot, so the
+    extrema of each pixel column are preserved.
+
+    :param y: Data.
+    :type y: 1D NumPy array
+    :param num_buckets: Number of buckets. If 0, or if ``y`` is too short to
+                        be decimated, all the points are kept.
+    :type num_buckets: int
+
+    :returns: Indices of the points to keep.
+    :rtype: 1D NumPy array of int
+    """
+    y = np.asarray(y)
+    n = len(y)
+
+    if num_buckets <= 0 or n <= 2 * num_buckets:
+        return np.arange(n)
+
+    # The last bucket is shorter if n is not a multiple of bucket_size, it
+    # is treated separately
+    bucket_size = n // num_buckets
+    num_full = n // bucket_size
+    buckets = y[: num_full * bucket_size].reshape(num_full, bucket_size)
+    starts = np.arange(num_full) * bucket_size
+
+    indices = [
+        [0, n - 1],
+        starts + np.argmin(buckets, axis=1),
+        starts + np.argmax(buckets, axis=1),
+    ]
+
+    if num_full * bucket_size < n:
+        rest = y[num_full * bucket_size :]
+        indices.append(
+            num_full * bucket_size + np.array([np.argmin(rest), np.argmax(rest)])
+        )
+
+    return np.unique(np.concatenate(indices))
+
+
+def window_indices(x, y, num_buckets, xmin=None, xmax=None):
+    """Return the sorted indices of the points of ``y`` to keep so that the
+    plot between ``xmin`` and ``xmax`` looks the same.
+
+    The points in the window, and the ones on each side of it, are decimated
+    separately with ``num_buckets`` buckets each (see
+    :py:func:`minmax_indices`). So, the window keeps all its resolution when
+    the plot is zoomed, while the minimum and the maximum of all the data,
+    which determine the automatic limits of the y axis, are unchanged.
+
+    :param x: Coordinates, sorted.
+    :type x: 1D NumPy array
+    :param y: Data.
+    :type y: 1D NumPy array
+    :param num_buckets: Number of buckets.
+    :type num_buckets: int
+    :param xmin: Beginning of the plotted window (None for no limit).
+    :type xmin: float or None
+    :param xmax: End of the plotted window (None for no limit).
+    :type xmax: float or None
+
+    :returns: Indices of the points to keep.
+    :rtype: 1D NumPy array of int
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    start = 0 if xmin is None else np.searchsorted(x, xmin, side="left")
+    end = len(x) if xmax is None else np.searchsorted(x, xmax, side="right")
+
+    return np.concatenate(
+        [
+            first + minmax_indices(y[first:last], num_buckets)
+            for first, last in ((0, start), (start, end), (end, len(x)))
+            if last > first
+        ]
+        or [np.arange(0)]
+    )
+
+
+def decimate(x, y, num_buckets=DEFAULT_BUCKETS, xmin=None, xmax=None):
+    """Return ``x`` and ``y`` with only the minimum and maximum of ``y`` in
+    each of ``num_buckets`` buckets, in the window between ``xmin`` and
+    ``xmax`` and outside it (see :py:func:`window_indices`)."""
+    indices = window_indices(x, y, num_buckets, xmin, xmax)
+    if len(indices) == len(y):
+        return x, y
+    return np.asarray(x)[indices], np.asarray(y)[indices]
+
+
+def decimate_timeseries(
+    timeseries, num_buckets=DEFAULT_BUCKETS, xmin=None, xmax=None
+):
+    """Return a real ``timeseries`` with only the minimum and maximum in each
+    of ``num_buckets`` buckets, in the window between ``xmin`` and ``xmax``
+    and outside it (see :py:func:`window_indices`)."""
+    indices = window_indices(timeseries.t, timeseries.y, num_buckets, xmin, xmax)
+    if len(indices) == len(timeseries):
+        return timeseries
+    return TimeSeries(timeseries.t[indices], timeseries.y[indices])
@@ -16,13 +16,266 @@
 # You should have received a copy of the GNU General Public License along with
 # this program; if not, see <https://www.gnu.org/licenses/>.
 
+import itertools
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 
 from kuibit import argparse_helper as kah
-from kuibit.simdir import SimDir
+
+import simdir_cache
+
+# Coordinates that define a point for each type of data
+AXES = {
+    "x": ("x",),
+    "y": ("y",),
+    "z": ("z",),
+    "xy": ("x", "y"),
+    "xz": ("x", "z"),
+    "yz": ("y", "z"),
+    "xyz": ("x", "y", "z"),
+}
+
+
+def read_points(args):
+    """Return the points to extract as an array with shape (num_points, dim).
+
+    The points are read from ``args.points_file`` if given (one point per row,
+    one column per coordinate of the data type), otherwise from the
+    ``--origin`` arguments.
+    """
+    axes = AXES[args.type]
+
+    if args.points_file is not None:
+        points = np.loadtxt(args.points_file, ndmin=2)
+        assert points.shape[1] == len(axes), (
+            f"The points in {args.points_file} must have {len(axes)} "
+            f"column(s) ({', '.join(axes)}) to extract from {args.type} data"
+        )
+        return points
+
+    values = [getattr(args, f"origin_{axis}") for axis in axes]
+    assert all(value is not None for value in values), (
+        f"To extract 0D data from {len(axes)}D {args.type} data, use "
+        + " ".join(f"-{axis} <value>" for axis in axes)
+    )
+    return np.array([values])
+
+
+class PointSampler:
+    """Evaluate grid data at fixed points with multilinear interpolation.
+
+    Going through ``HierarchicalGridData.__call__`` means looking up the
+    finest component for each point and building a SciPy interpolator for
+    each component, every time. Here, we find the component that contains
+    each point and the multilinear weights only once, and reuse them as long
+    as the grid structure does not change (e.g., until the next regridding).
+    The values are the same as the ones of ``HierarchicalGridData.__call__``.
+
+    :param points: Points where to evaluate the data.
+    :type points: 2D NumPy array with shape (num_points, dim)
+    """
+
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=float)
+        self._structure = None
+        # Dictionary with keys (ref_level, component index) and values
+        # (indices of the points, indices of the cells, weights)
+        self._stencils = None
+
+    @staticmethod
+    def grid_structure(data):
+        """Return a hashable description of the grid structure of ``data``."""
+        return tuple(
+            (ref_level, comp_index, tuple(comp.x0), tuple(comp.shape))
+            for ref_level, comp_index, comp in data
+        )
+
+    def _compute_stencils(self, data):
+        """Find the components and the weights for all the points."""
+        dim = self.points.shape[1]
+        # Offsets of the 2^dim vertices of the cell around the point
+        offsets = np.array(list(itertools.product((0, 1), repeat=dim)))
+
+        stencils = {}
+        for point_index, point in enumerate(self.points):
+            # Same search as HierarchicalGridData.finest_component_at_point,
+            # but here we also need the index of the component
+            for ref_level, comp_index, comp in data.iter_from_finest():
+                if point in comp.grid:
+                    break
+            else:
+                raise ValueError(f"{point} outside the grid")
+
+            shape = np.array(comp.shape)
+            position = (point - comp.x0) / comp.dx
+            lower = np.clip(np.floor(position).astype(int), 0, np.maximum(shape - 2, 0))
+            # As in kuibit, points within half a cell from the boundary take
+            # the value at the boundary
+            fraction = np.where(shape > 1, np.clip(position - lower, 0, 1), 0)
+
+            vertices = np.minimum(lower + offsets, shape - 1)
+            weights = np.prod(
+                np.where(offsets == 1, fraction, 1 - fraction), axis=1
+            )
+
+            stencil = stencils.setdefault((ref_level, comp_index), ([], [], []))
+            stencil[0].append(point_index)
+            stencil[1].append(vertices)
+            stencil[2].append(weights)
+
+        # We organize the vertices so that we can use them for fancy indexing,
+        # data[vertices] has shape (num_points_in_component, 2^dim)
+        return {
+            key: (
+                np.array(point_indices),
+                tuple(np.moveaxis(np.array(vertices), -1, 0)),
+                np.array(weights),
+            )
+            for key, (point_indices, vertices, weights) in stencils.items()
+        }
+
+    def __call__(self, data):
+        """Return the values of ``data`` at the points.
+
+        :param data: Grid data at a given iteration.
+        :type data: :py:class:`~.HierarchicalGridData`
+        """
+        structure = self.grid_structure(data)
+        if structure != self._structure:
+            self._stencils = self._compute_stencils(data)
+            self._structure = structure
+
+        values = np.zeros(len(self.points), dtype=data.dtype)
+        for (ref_level, comp_index), stencil in self._stencils.items():
+            point_indices, vertices, weights = stencil
+            comp_data = data[ref_level][comp_index].data
+            values[point_indices] = np.sum(comp_data[vertices] * weights, axis=1)
+        return values
+
+
+def sample_iterations(gf, iterations, points, sampler=None):
+    """Return the output rows (iteration, time, values at the points) for the
+    given iterations of the grid function ``gf``.
+
+    If ``sampler`` is not None, it is used to evaluate the data instead of
+    the interpolation in kuibit."""
+    rows = np.zeros((len(iterations), 2 + len(points)))
+    for index, iteration in enumerate(iterations):
+        rows[index, 0] = iteration
+        rows[index, 1] = gf.time_at_iteration(iteration)
+        # gf[iteration] reads the grid function from disk, so we read it once
+        # and sample all the points in a single call
+        if sampler is None:
+            rows[index, 2:] = gf[iteration](points)
+        else:
+            rows[index, 2:] = sampler(gf[iteration])
+    # The HDF5 readers keep every component they read, so without this the
+    # memory grows with the number of iterations. The ASCII readers parse
+    # whole files at once and have no cache to clear.
+    if hasattr(gf, "clear_cache"):
+        gf.clear_cache()
+    return rows
+
+
+def read_checkpoint(path, num_columns):
+    """Return the rows saved in the checkpoint file ``path``.
+
+    The checkpoint is a raw binary file of float64 rows that is only ever
+    appended to. If the last row is incomplete (for example, because the
+    process was killed while writing it), it is dropped from the file.
+
+    The rows are memory-mapped, so they are not read in memory all at once.
+    """
+    num_rows = 0
+    if os.path.exists(path):
+        row_size = num_columns * np.dtype(np.float64).itemsize
+        num_rows, remainder = divmod(os.path.getsize(path), row_size)
+        if remainder:
+            with open(path, "r+b") as file_:
+                file_.truncate(num_rows * row_size)
+
+    # np.memmap cannot map empty files
+    if num_rows == 0:
+        return np.zeros((0, num_columns))
+
+    return np.memmap(
+        path, dtype=np.float64, mode="r", shape=(num_rows, num_columns)
+    )
+
+
+def append_to_checkpoint(path, rows):
+    """Append ``rows`` to the checkpoint file ``path`` and flush them to disk."""
+    with open(path, "ab") as file_:
+        file_.write(np.ascontiguousarray(rows, dtype=np.float64).tobytes())
+        file_.flush()
+        os.fsync(file_.fileno())
+
+
+def check_checkpoint_points(path, points):
+    """Make sure that the checkpoint was written for the same ``points``.
+
+    The points are saved in ``path`` the first time, and compared with the
+    saved ones afterwards."""
+    if not os.path.exists(path):
+        np.save(path, points)
+        return
+    saved_points = np.load(path)
+    if not np.array_equal(saved_points, points):
+        raise ValueError(
+            f"The checkpoint was written for different points ({path})."
+            " Use --restart to discard it."
+        )
+
+
+def write_output(path, rows, block_size=2**17):
+    """Save ``rows`` sorted by iteration to the .npy file ``path``.
+
+    The file is memory-mapped and filled ``block_size`` rows at the time, so
+    only the sorting indices have to fit in memory. The file is first written
+    with a temporary name, so ``path`` is never left half-written.
+    """
+    tmp_path = path + ".tmp"
+    output = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float64, shape=rows.shape
+    )
+    order = np.argsort(rows[:, 0], kind="stable")
+    for start in range(0, len(order), block_size):
+        output[start:start + block_size] = rows[order[start:start + block_size]]
+    output.flush()
+    del output
+    os.replace(tmp_path, path)
+
+
+# Grid function read by each worker process, set by init_worker
+_worker_gf = None
+# PointSampler of each worker process (or None), set by init_worker
+_worker_sampler = None
+
+
+def init_worker(datadir, ignore_symlinks, pickle_file, data_type, variable, sampler):
+    """Open the SimDir in a worker process.
+
+    Each worker has its own SimDir because they cannot be shared across
+    processes."""
+    global _worker_gf, _worker_sampler
+    # Only the main process updates the SimDir cache
+    sd = simdir_cache.load_simdir(
+        datadir,
+        ignore_symlinks=ignore_symlinks,
+        pickle_file=pickle_file,
+        save_at_exit=False,
+    )
+    _worker_gf = sd.gridfunctions[data_type][variable]
+    _worker_sampler = sampler
+
+
+def sample_iterations_in_worker(iterations, points):
+    """Same as sample_iterations, but with the grid function of the worker."""
+    return sample_iterations(_worker_gf, iterations, points, _worker_sampler)
+
 
 if __name__ == "__main__":
 
@@ -71,15 +324,64 @@ if __name__ == "__main__":
         help="The z value of the point to extract"
     )
 
+    parser.add_argument(
+        "--points-file",
+        type=str,
+        help="File with the points to extract, one per row. The columns are"
+        " the coordinates of the points (e.g., x and z for xz data)."
+        " If given, the -x, -y, and -z options are ignored.",
+    )
+
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to read the iterations"
+        " (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--direct-sampling",
+        action="store_true",
+        help="Find the grid cells around the points only when the grid"
+        " structure changes and interpolate directly on them. This is"
+        " much faster than going through kuibit for every iteration.",
+    )
+
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=100,
+        help="Number of iterations extracted between writes to the"
+        " checkpoint file (default: %(default)s)",
+    )
+
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Discard the iterations already extracted in a previous run.",
+    )
+
     args = kah.get_args(parser)
 
-    if args.outname is None:
-        outname = f"{args.variable}_x_{args.origin_x}_y_{args.origin_y}_z_{args.origin_z}.npz"
+    if args.outname is None and args.points_file is not None:
+        points_name = os.path.splitext(os.path.basename(args.points_file))[0]
+        outname = f"{args.variable}_{points_name}.npy"
+    elif args.outname is None:
+        outname = f"{args.variable}_x_{args.origin_x}_y_{args.origin_y}_z_{args.origin_z}.npy"
+    elif not args.outname.endswith(".npy"):
+        outname = args.outname + ".npy"
     else:
         outname = args.outname
 
     output_path = os.path.join(args.outdir, outname)
 
+    # The iterations extracted so far are appended to the checkpoint file, so
+    # that we can resume from there if we are killed, or when the simulation
+    # has produced new iterations
+    checkpoint_path = output_path + ".ckpt"
+    checkpoint_points_path = checkpoint_path + ".points.npy"
+
     logger = logging.getLogger(__name__)
 
     if args.verbose:
@@ -88,7 +390,11 @@ if __name__ == "__main__":
 
     logger.debug(f"Reading grid function {args.variable}. This may take a while.")
 
-    sd = SimDir(args.datadir, ignore_symlinks=args.ignore_symlinks)
+    sd = simdir_cache.load_simdir(
+        args.datadir,
+        ignore_symlinks=args.ignore_symlinks,
+        pickle_file=args.pickle_file,
+    )
     available_gfs = sd.gridfunctions[args.type]
 
     if not (args.variable in available_gfs):
@@ -100,56 +406,70 @@ if __name__ == "__main__":
     logger.debug("Reading available iterations")
     available_iterations = gf.available_iterations
     
-    logger.debug("Allocating output buffer")
-    output_data = np.zeros((len(available_iterations), 3))
-     
     logger.debug("Check if the user point/variable type combination is valid")
-    if args.origin_x == None:
-        x_is_set = False
-    else:
-        x_is_set = True
+    points = read_points(args)
+    logger.debug(f"Extracting {len(points)} point(s)")
 
-    if args.origin_y == None:
-        y_is_set = False
-    else:
-        y_is_set = True
+    if args.restart:
+        logger.debug(f"Removing checkpoint {checkpoint_path}")
+        for path in (checkpoint_path, checkpoint_points_path):
+            if os.path.exists(path):
+                os.remove(path)
 
-    if args.origin_z == None:
-        z_is_set = False
+    num_columns = 2 + len(points)
+    sampler = PointSampler(points) if args.direct_sampling else None
+    check_checkpoint_points(checkpoint_points_path, points)
+    done_iterations = set(
+        read_checkpoint(checkpoint_path, num_columns)[:, 0].astype(int)
+    )
+    iterations = [it for it in available_iterations if it not in done_iterations]
+    logger.debug(
+        f"{len(done_iterations)} iterations found in {checkpoint_path},"
+        f" {len(iterations)} iterations to extract"
+    )
+
+    logger.debug("Dumping data into checkpoint. This may take a while.")
+    chunk_size = args.checkpoint_every
+    if args.jobs > 1:
+        # We split the iterations in more chunks than workers, so that
+        # workers that finish early can pick up more work
+        chunk_size = min(chunk_size, -(-len(iterations) // (4 * args.jobs)))
+    chunk_size = max(1, chunk_size)
+    chunks = [
+        iterations[start:start + chunk_size]
+        for start in range(0, len(iterations), chunk_size)
+    ]
+
+    if args.jobs > 1 and chunks:
+        logger.debug(f"Using {args.jobs} processes on {len(chunks)} chunks")
+
+        with ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=init_worker,
+            initargs=(
+                args.datadir,
+                args.ignore_symlinks,
+                args.pickle_file,
+                args.type,
+                args.variable,
+                sampler,
+            ),
+        ) as executor:
+            # map returns the results in the same order as the chunks
+            results = executor.map(
+                sample_iterations_in_worker,
+                chunks,
+                [points] * len(chunks),
+            )
+            for rows in results:
+                append_to_checkpoint(checkpoint_path, rows)
     else:
-        z_is_set = True
-
-    if args.type == "x":
-        assert x_is_set, "To extract 0D data from 1D x data, use -x <value>"
-        point = (args.origin_x)
-    elif args.type == "y":
-        assert y_is_set, "To extract 0D data from 1D y data, use -y <value>"
-        point = (args.origin_y)
-    elif args.type == "z":
-        assert z_is_set, "To extract 0D data from 1D z data, use -z <value>"
-        point = (args.origin_z)
-    elif args.type == "xy":
-        assert (x_is_set and y_is_set), "To extract 0D data from 2D xy data, use -x <value> -y <value>"
-        point = (args.origin_x, args.origin_y)
-    elif args.type == "xz":
-        assert (x_is_set and z_is_set), "To extract 0D data from 2D xz data, use -x <value> -z <value>"
-        point = (args.origin_x, args.origin_z)
-    elif args.type == "xz":
-        assert (x_is_set and z_is_set), "To extract 0D data from 2D xz data, use -x <value> -z <value>"
-        point = (args.origin_x, args.origin_z)
-    elif args.type == "xyz":
-        assert (x_is_set and y_is_set and z_is_set), "To extract 0D data from 3D xyz data, use -x <value> -y <value> -z <value>"
-        point = (args.origin_x, args.origin_y, args.origin_z)
-
-    logger.debug("Dumping data into output buffer. This may take a while.")
-    index = 0
-    for iteration in available_iterations:
-        output_data[index, 0] = iteration
-        output_data[index, 1] = gf.time_at_iteration(iteration)
-        output_data[index, 2] = float( gf[iteration](point) )
-        index += 1
-
-    logger.debug("Serializing data. This may take a while.")
-    np.save(outname, output_data)
+        for chunk in chunks:
+            append_to_checkpoint(
+                checkpoint_path, sample_iterations(gf, chunk, points, sampler)
+            )
+
+    logger.debug(f"Serializing data to {output_path}. This may take a while.")
+    write_output(output_path, read_checkpoint(checkpoint_path, num_columns))
 
     logger.debug("DONE.")
@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+import numpy as np
+from kuibit.grid_data import UniformGridData
+from kuibit.uniform_grid import UniformGrid
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCache:
+    """Store of grid data resampled on uniform grids, saved as ``.npy`` files
+    in ``directory``.
+
+    Each entry is identified by all the parameters that determine the
+    resampled data, so frames can be rendered again with different styles
+    (colormap, color limits, log scale, ...) without reading the original
+    files. The total size of the store is kept below ``max_size`` bytes by
+    deleting the least recently used entries. Entries are written atomically,
+    so the same store can be used by multiple processes.
+
+    :param directory: Directory where to save the frames.
+    :type directory: str
+    :param max_size: Maximum size of the store in bytes.
+    :type max_size: int
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        # Estimate of the size of the store. It is updated with what this
+        # process writes, and computed again from the directory when it goes
+        # above max_size (other processes may have deleted files).
+        self.size = sum(size for _, size, _ in self._entries())
+        if self.size > self.max_size:
+            self.evict()
+
+    @staticmethod
+    def key(datadir, variable, plane, x0, x1, shape, iteration, absolute, resample):
+        """Return the identifier of a resampled frame."""
+        description = repr(
+            (
+                os.path.realpath(datadir),
+                variable,
+                plane,
+                [float(x) for x in x0],
+                [float(x) for x in x1],
+                [int(n) for n in shape],
+                int(iteration),
+                bool(absolute),
+                bool(resample),
+            )
+        )
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def _entries(self):
+        """Return a list of (path, size, last access) for all the entries."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".npy"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Removed by another process
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key, x0, x1, shape):
+        """Return the frame ``key`` as a UniformGridData on the grid with the
+        given ``x0``, ``x1``, and ``shape``, or None if it is not stored."""
+        path = self._path(key)
+        try:
+            data = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        # The modification time is used as time of last access for the
+        # eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        logger.debug(f"Read resampled frame from {path}")
+        grid = UniformGrid(shape, x0=x0, x1=x1)
+        return UniformGridData(grid, data)
+
+    def put(self, key, data):
+        """Store the UniformGridData ``data`` as frame ``key``."""
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file_:
+                np.save(file_, data.data)
+                size = file_.tell()
+            os.replace(tmp_path, path)
+        except OSError as exce:
+            # We can live without the cache
+            logger.debug(f"Could not write resampled frame {path}: {exce}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        logger.debug(f"Saved resampled frame to {path}")
+        self.size += size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the store is smaller
+        than ``max_size``."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self.size = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if self.size <= self.max_size:
+                break
+            logger.debug(f"Evicting resampled frame {path}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
@@ -0,0 +1,240 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+import h5py
+import numpy as np
+
+import data_loader
+
+logger = logging.getLogger(__name__)
+
+# Columns of the saved multipoles
+COLUMNS = ["t", "Re", "Im"]
+
+# Number of hexadecimal digits of the content hash used in file names
+DIGEST_LENGTH = 16
+
+
+def multipole_array(timeseries):
+    """Return the complex ``timeseries`` as an array with columns t, Re, Im.
+
+    This is the same layout as the ASCII files written by ``phi.save``.
+    """
+    return np.column_stack([timeseries.t, timeseries.y.real, timeseries.y.imag])
+
+
+def update_hash(hasher, name, radius, mult_l, mult_m, array):
+    """Add a multipole to the content hash ``hasher``."""
+    hasher.update(repr((name, float(radius), int(mult_l), int(mult_m))).encode())
+    hasher.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+
+
+def dataset_name(radius, mult_l, mult_m):
+    """Return the path of the dataset of a given multipole in an archive."""
+    return f"r{radius}/l{mult_l}_m{mult_m}"
+
+
+def multipole_filename(name, radius, mult_l, mult_m, digest, extension):
+    """Return the name of the file of a single multipole.
+
+    The name contains ``digest``, the hash of the content, so the same data
+    always has the same name, and different data never does.
+    """
+    return f"{name}_l{mult_l}_m{mult_m}_r{radius}_{digest}{extension}"
+
+
+def archive_filename(name, digest):
+    """Return the name of the file with all the multipoles of ``name``."""
+    return f"{name}_all_{digest}.h5"
+
+
+def write_archive(path, name, multipoles):
+    """Write all the ``multipoles`` into the HDF5 file ``path``.
+
+    Each multipole is a dataset with columns t, Re, Im, named as returned by
+    :py:func:`dataset_name`, with attributes ``name``, ``radius``, ``l``, and
+    ``m``.
+
+    :param path: Output file.
+    :type path: str
+    :param name: Name of the multipole variable.
+    :type name: str
+    :param multipoles: Iterable of (radius, l, m, timeseries). The
+                       timeseries are written as they come, so they do not
+                       have to be all in memory.
+    :type multipoles: iterable of tuples
+
+    :returns: Number of multipoles written, and hash of the content.
+    :rtype: tuple of int and str
+    """
+    hasher = hashlib.sha1()
+    num_written = 0
+
+    with h5py.File(path, "w") as archive:
+        archive.attrs["name"] = name
+        archive.attrs["columns"] = COLUMNS
+
+        for radius, mult_l, mult_m, timeseries in multipoles:
+            logger.debug(f"Writing radius {radius}, (l, m) = ({mult_l}, {mult_m})")
+            array = multipole_array(timeseries)
+            update_hash(hasher, name, radius, mult_l, mult_m, array)
+
+            dataset = archive.create_dataset(
+                dataset_name(radius, mult_l, mult_m), data=array
+            )
+            dataset.attrs["name"] = name
+            dataset.attrs["radius"] = radius
+            dataset.attrs["l"] = mult_l
+            dataset.attrs["m"] = mult_m
+            num_written += 1
+
+    return num_written, hasher.hexdigest()[:DIGEST_LENGTH]
+
+
+def save_archive(name, multipoles, directory="."):
+    """Write all the ``multipoles`` into an HDF5 file in ``directory`` and
+    return its path.
+
+    The file is named after the hash of its content (see
+    :py:func:`archive_filename`). It is written to a temporary file and
+    moved in place at the end, so it is never left incomplete, and
+    concurrent runs in the same directory do not interfere. See
+    :py:func:`write_archive` for the arguments.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{name}_all.", suffix=".tmp"
+    )
+    os.close(fd)
+    try:
+        num_written, digest = write_archive(tmp_path, name, multipoles)
+        path = os.path.join(directory, archive_filename(name, digest))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    logger.debug(f"Saved {num_written} multipoles")
+    return path
+
+
+def save_multipole(name, radius, mult_l, mult_m, timeseries, file_format, directory="."):
+    """Save a single multipole in ``directory`` and return the path.
+
+    With ``file_format="npy"``, the file is a NumPy array with columns t, Re,
+    Im, which can be memory-mapped. With ``file_format="h5"``, the file has
+    the same layout of :py:func:`write_archive` with a single multipole, so
+    it also has the metadata as attributes. In both cases, the name of the
+    file contains the hash of the content (see
+    :py:func:`multipole_filename`). If the file already exists, it is not
+    written again.
+
+    :param name: Name of the multipole variable.
+    :type name: str
+    :param radius: Extraction radius.
+    :type radius: float
+    :param mult_l: Multipole number l.
+    :type mult_l: int
+    :param mult_m: Multipole number m.
+    :type mult_m: int
+    :param timeseries: Multipole.
+    :type timeseries: :py:class:`~.TimeSeries`
+    :param file_format: npy or h5.
+    :type file_format: str
+    :param directory: Where to save the file.
+    :type directory: str
+
+    :returns: Path of the file.
+    :rtype: str
+    """
+    if file_format not in ("npy", "h5"):
+        raise ValueError(f"Unknown format {file_format}")
+
+    array = multipole_array(timeseries)
+    hasher = hashlib.sha1()
+    update_hash(hasher, name, radius, mult_l, mult_m, array)
+    digest = hasher.hexdigest()[:DIGEST_LENGTH]
+
+    path = os.path.join(
+        directory,
+        multipole_filename(name, radius, mult_l, mult_m, digest, f".{file_format}"),
+    )
+
+    if os.path.exists(path):
+        logger.debug(f"{path} already exists")
+        return path
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        if file_format == "npy":
+            with os.fdopen(fd, "wb") as file_:
+                np.save(file_, array)
+        else:
+            os.close(fd)
+            write_archive(tmp_path, name, [(radius, mult_l, mult_m, timeseries)])
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return path
+
+
+def load_multipole(path, radius=None, mult_l=None, mult_m=None):
+    """Return the multipole saved in ``path`` as an array with columns t, Re,
+    Im.
+
+    ``path`` can be any file written by ``save_multipole.py``: ASCII, ``.npy``
+    (memory-mapped), or HDF5. HDF5 archives with more than one multipole
+    need ``radius``, ``mult_l``, and ``mult_m`` to choose which one to read.
+
+    :param path: File to read.
+    :type path: str
+    :param radius: Extraction radius (only for HDF5 archives).
+    :type radius: float or None
+    :param mult_l: Multipole number l (only for HDF5 archives).
+    :type mult_l: int or None
+    :param mult_m: Multipole number m (only for HDF5 archives).
+    :type mult_m: int or None
+
+    :returns: Multipole with columns t, Re, Im.
+    :rtype: 2D NumPy array
+    """
+    if os.path.splitext(path)[1] not in (".h5", ".hdf5"):
+        return np.column_stack(data_loader.load_columns(path, [0, 1, 2]))
+
+    with h5py.File(path, "r") as archive:
+        datasets = []
+        archive.visititems(
+            lambda name, item: datasets.append(name)
+            if isinstance(item, h5py.Dataset)
+            else None
+        )
+
+        if None not in (radius, mult_l, mult_m):
+            selected = [
+                name
+                for name in datasets
+                if float(archive[name].attrs["radius"]) == float(radius)
+                and int(archive[name].attrs["l"]) == int(mult_l)
+                and int(archive[name].attrs["m"]) == int(mult_m)
+            ]
+        elif len(datasets) == 1:
+            selected = datasets
+        else:
+            raise ValueError(
+                f"{path} contains {len(datasets)} multipoles, choose one with"
+                " radius, l, and m"
+            )
+
+        if not selected:
+            raise ValueError(
+                f"{path} does not contain radius {radius}, (l, m) ="
+                f" ({mult_l}, {mult_m})"
+            )
+
+        logger.debug(f"Reading {selected[0]} from {path}")
+        return archive[selected[0]][()]
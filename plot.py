@@ -2,9 +2,10 @@
 doc="""Plot data.
 
 Usage:
-  plot.py plt <x_axis> <y_axis> <file> [--abslog] [--save=<name>] [--xlabel=<label>] [--ylabel=<label>] [--lines] [--xmin=<value>] [--xmax=<value>] [--ymin=<value>] [--ymax=<value>]
-  plot.py fft <x_axis> <y_axis> <file> [--positive] [--alpha=<value>] [--smooth] [--save=<name>] [--xlabel=<label>] [--ylabel=<label>] [--lines | --linespoints] [--xmin=<value>] [--xmax=<value>] [--ymin=<value>] [--ymax=<value>]
-  plot.py psd <x_axis> <y_axis> <file> [--positive] [--alpha=<value>] [--peak] [--smooth] [--save=<name>] [--xlabel=<label>] [--ylabel=<label>] [--lines | --linespoints] [--mark=<value>] [--xmin=<value>] [--xmax=<value>] [--ymin=<value>] [--ymax=<value>]
+  plot.py plt <x_axis> <y_axis> <file> [--npz-key=<name>] [--abslog] [--decimate=<n>] [--save=<name>] [--xlabel=<label>] [--ylabel=<label>] [--lines] [--xmin=<value>] [--xmax=<value>] [--ymin=<value>] [--ymax=<value>]
+  plot.py fft <x_axis> <y_axis> <file> [--npz-key=<name>] [--positive] [--alpha=<value>] [--workers=<n>] [--smooth] [--save=<name>] [--xlabel=<label>] [--ylabel=<label>] [--lines | --linespoints] [--xmin=<value>] [--xmax=<value>] [--ymin=<value>] [--ymax=<value>]
+  plot.py psd <x_axis> <y_axis> <file> [--npz-key=<name>] [--positive] [--alpha=<value>] [--workers=<n>] [--welch] [--segment=<n>] [--overlap=<n>] [--window=<name>] [--peak] [--peaks=<k>] [--peak-interp=<method>] [--peak-output=<file>] [--smooth] [--save=<name>] [--xlabel=<label>] [--ylabel=<label>] [--lines | --linespoints] [--mark=<value>] [--xmin=<value>] [--xmax=<value>] [--ymin=<value>] [--ymax=<value>]
+  plot.py batch (fft | psd) <x_axis> <y_axes> <files>... [--npz-key=<name>] [--positive] [--alpha=<value>] [--workers=<n>] [--peaks=<k>] [--peak-interp=<method>] [--table=<name>] [--figures=<dir>] [--xlabel=<label>] [--ylabel=<label>]
   plot.py (-h | --help)
   plot.py --version
 
@@ -12,12 +13,39 @@ Options:
   -h --help         Show this screen.
   --version         Show version.
   --positive        Only plot positive frequencies.
+  --npz-key=<name>  Name of the array to plot in .npz files.
   --abslog          Plot the function in log-log scale.
+  --decimate=<n>    With --lines, only plot the minimum and maximum of the
+                    data in <n> buckets (e.g., 2000), which looks the same
+                    but is faster for long data. 0 to plot all the points
+                    [default: 0].
   --alpha=<value>   The alpha value of the Tukey window [default: 0.0].
+  --workers=<n>     Number of threads used by the FFT, -1 to use all the
+                    cores [default: 1].
+  --welch           Average the PSD over overlapping segments (Welch's method).
+  --segment=<n>     Number of points in each Welch segment [default: 4096].
+  --overlap=<n>     Number of points shared by consecutive Welch segments
+                    (default: half segment).
+  --window=<name>   Window applied to each Welch segment. Any window known to
+                    scipy.signal.get_window [default: tukey].
   --peak            Compute and print the peak of the spectrogram.
+  --peaks=<k>       Number of peaks to find, from the highest [default: 1].
+  --peak-interp=<method>
+                    Interpolation of the peaks between frequency bins:
+                    quadratic, gaussian (quadratic in log), or none
+                    [default: quadratic].
+  --peak-output=<file>
+                    Write the peaks to a file (JSON if the extension is
+                    .json, CSV otherwise).
   --smooth          Apply the Savitzky - Golay smoothing filter. 
   --save=<name>     Save a figure.
   --mark=<value>    Marks a x value on the plot with a vertical line.
+  --table=<name>    File where the batch mode writes the peaks of each
+                    spectrum (JSON if the extension is .json, CSV otherwise)
+                    [default: spectra.csv].
+  --figures=<dir>   Directory where the batch mode saves one figure per
+                    spectrum, in the same subdirectories as the inputs
+                    (default: no figures).
   --xlabel=<label>  The plot label on the x axis [default: $x$].
   --ylabel=<label>  The plot label on the y axis [default: $y$].
   --lines           Use lines instead of points to plot.
@@ -37,13 +65,17 @@ import plot_types
 if __name__ ==  "__main__":
     arguments = docopt(doc, version="Plot 1.0")
 
-    if arguments["plt"]:
+    if arguments["batch"]:
+        assert float(arguments["--alpha"]) >= 0 and float(arguments["--alpha"]) <= 1.0, "The Tukey window alpha parameter must be in the interval (0,1)"
+        plot_types.batch_spectra(arguments)
+
+    elif arguments["plt"]:
         plot_types.plot(arguments)
 
-    if arguments["fft"]:
+    elif arguments["fft"]:
         plot_types.fft_plot(arguments)
 
-    if arguments["psd"]:
+    elif arguments["psd"]:
         assert float(arguments["--alpha"]) >= 0 and float(arguments["--alpha"]) <= 1.0, "The Tukey window alpha parameter must be in the interval (0,1)"
         plot_types.psd_plot(arguments)
 
@@ -16,10 +16,12 @@
 # You should have received a copy of the GNU General Public License along with
 # this program; if not, see <https://www.gnu.org/licenses/>.
 
+import contextlib
 import logging
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 from kuibit import argparse_helper as kah
-from kuibit.simdir import SimDir
 from kuibit.visualize_matplotlib import (
     add_text_to_corner,
     get_figname,
@@ -31,13 +33,549 @@ from kuibit.visualize_matplotlib import (
     setup_matplotlib,
 )
 
+import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 
+import simdir_cache
+from frame_cache import FrameCache
+from video_writer import VideoWriter
+
 # NOTE: This example is also implemented in a movie file with the same name. If
 #       you update this file, you probably want to update the movie file as
 #       well.
 
+logger = logging.getLogger(__name__)
+
+# Maximum number of values kept to estimate the percentiles of the color
+# scale with --auto-clim
+CLIM_SAMPLES = 2**20
+
+# A frame of the movie: its number in the file name, and where to find the
+# data
+Frame = namedtuple(
+    "Frame", ["number", "time", "iteration", "punctures_x", "punctures_y"]
+)
+
+
+def matplotlib_params(args):
+    """Return the matplotlib parameters used for all the frames."""
+    return {
+        'mathtext.fontset' : 'cm',
+        'font.family' : 'Latin Modern Roman',
+        'font.size' : args.font_size,
+        'axes.labelsize' : args.font_size,
+        'xtick.labelsize' : args.font_size,
+        'ytick.labelsize' : args.font_size,
+        'figure.figsize' : [10, 8]
+    }
+
+
+def open_simdir(args, save_at_exit=True):
+    return simdir_cache.load_simdir(
+        args.datadir,
+        ignore_symlinks=args.ignore_symlinks,
+        pickle_file=args.pickle_file,
+        save_at_exit=save_at_exit,
+    )
+
+
+def match_times(times, available_times, tolerance=None):
+    """Return the index of the element of ``available_times`` closest to each
+    of ``times``, or -1 when there is none within ``tolerance``.
+
+    This is done with a binary search on the sorted ``available_times``, so
+    the cost is O(N log N) instead of a linear scan for each time. If
+    ``tolerance`` is None, it is one thousandth of the smallest spacing
+    between available times, which absorbs the floating-point round-off
+    between different outputs of the same time.
+
+    :param times: Times to match.
+    :type times: 1D NumPy array
+    :param available_times: Times to match against.
+    :type available_times: list or 1D NumPy array
+    :param tolerance: Maximum distance between matched times.
+    :type tolerance: float or None
+
+    :returns: Indices in ``available_times``, or -1.
+    :rtype: 1D NumPy array of int
+    """
+    times = np.asarray(times, dtype=float)
+    available_times = np.asarray(available_times, dtype=float)
+
+    if len(available_times) == 0:
+        return np.full(len(times), -1)
+
+    order = np.argsort(available_times, kind="stable")
+    sorted_times = available_times[order]
+
+    if tolerance is None:
+        spacing = np.diff(sorted_times)
+        spacing = spacing[spacing > 0]
+        tolerance = 1e-3 * spacing.min() if len(spacing) else 1e-8
+
+    # Closest available time on the left and on the right
+    right = np.clip(np.searchsorted(sorted_times, times), 0, len(sorted_times) - 1)
+    left = np.clip(right - 1, 0, len(sorted_times) - 1)
+    closest = np.where(
+        np.abs(sorted_times[left] - times) <= np.abs(sorted_times[right] - times),
+        left,
+        right,
+    )
+
+    matched = np.abs(sorted_times[closest] - times) <= tolerance
+    return np.where(matched, order[closest], -1)
+
+
+def select_frames(sim, var, tolerance=None, tmin=None, tmax=None, every=1):
+    """Return the list of frames to render.
+
+    A frame is produced for each time at which we have both the position of
+    the punctures and the grid data (within ``tolerance``, see
+    :py:func:`match_times`). Only times between ``tmin`` and ``tmax`` are
+    considered, and of those only one every ``every``. The grid data is not
+    read here, so only the selected iterations are read when rendering."""
+    logger.debug("Reading puncture positional data")
+    puncture_1_x = sim.timeseries.scalar["pt_loc_x[0]"]
+    puncture_1_y = sim.timeseries.scalar["pt_loc_y[0]"]
+
+    puncture_2_x = sim.timeseries.scalar["pt_loc_x[1]"]
+    puncture_2_y = sim.timeseries.scalar["pt_loc_y[1]"]
+
+    # The iterations and times are taken once, so that all the puncture
+    # times are matched against the same sorted snapshot of the field times
+    # and the indices in matches refer to available_iterations
+    available_iterations = var.available_iterations
+    matches = match_times(puncture_1_x.t, var.available_times, tolerance)
+
+    # Make sure that the puncture and field data exist at this time
+    selected = matches >= 0
+    if tmin is not None:
+        selected &= puncture_1_x.t >= tmin
+    if tmax is not None:
+        selected &= puncture_1_x.t <= tmax
+
+    frames = []
+
+    for i in np.flatnonzero(selected)[::every]:
+        frames.append(
+            Frame(
+                # Frames are numbered consecutively, independently of i
+                number=len(frames),
+                time=puncture_1_x.t[i],
+                iteration=available_iterations[matches[i]],
+                punctures_x=[puncture_1_x.y[i], puncture_2_x.y[i]],
+                punctures_y=[puncture_1_y.y[i], puncture_2_y.y[i]],
+            )
+        )
+
+    return frames
+
+
+class FrameRenderer:
+    """Plot frames of the grid function ``var`` and save them to files.
+
+    If ``args.reuse_figure``, the figure is built for the first frame only.
+    For the following frames, we only update the image data, the punctures,
+    the time label, and the horizons (or grid structure). Otherwise, every
+    frame is drawn on a new figure.
+
+    If ``args.frame_cache`` is set, the data resampled on the plotting grid
+    is stored in a :py:class:`~.FrameCache` in that directory, and read from
+    there when the same frame is rendered again.
+
+    If ``args.video`` is set, frames are not saved to files: :py:meth:`render`
+    returns their pixels, to be passed to a :py:class:`~.VideoWriter`.
+
+    Data read by :py:meth:`color_limits` can be kept in ``preloaded`` to be
+    used for rendering.
+    """
+
+    def __init__(self, sim, var, args, figname):
+        self.sim = sim
+        self.var = var
+        self.args = args
+        self.figname = figname
+        self.x0, self.x1 = args.origin, args.corner
+        self.shape = [args.resolution, args.resolution]
+
+        if args.frame_cache is not None:
+            self.cache = FrameCache(
+                args.frame_cache, args.frame_cache_size * 1024**2
+            )
+        else:
+            self.cache = None
+
+        # Figure and artists that are updated frame by frame when reusing
+        # the figure
+        self.fig = None
+        self.ax = None
+        self.image = None
+        self.punctures = None
+        self.time_text = None
+        # Artists (horizons, grid structure) that have to be drawn again at
+        # each frame
+        self.frame_artists = []
+
+        # Data already read, with keys the iterations
+        self.preloaded = {}
+
+    @property
+    def label(self):
+        if self.args.absolute:
+            variable = f"abs({self.args.variable})"
+        else:
+            variable = self.args.variable
+
+        if self.args.logscale:
+            return f"log10({variable})"
+        return variable
+
+    def read(self, iteration):
+        """Return the data at the given iteration."""
+        if iteration in self.preloaded:
+            return self.preloaded.pop(iteration)
+        if self.args.absolute:
+            return abs(self.var[iteration])
+        return self.var[iteration]
+
+    def values_in_window(self, data):
+        """Return the values of all the components of ``data`` that are in
+        the plotting window, without ghost zones, as a 1D array."""
+        values = []
+        for _, _, comp in data.iter_from_finest():
+            grid = comp.grid
+            selection = []
+            for dim in range(grid.num_dimensions):
+                coordinates = grid.x0[dim] + np.arange(grid.shape[dim]) * grid.dx[dim]
+                in_window = (coordinates >= self.x0[dim]) & (
+                    coordinates <= self.x1[dim]
+                )
+                num_ghost = grid.num_ghost[dim]
+                if num_ghost > 0:
+                    in_window[:num_ghost] = False
+                    in_window[-num_ghost:] = False
+                selection.append(np.flatnonzero(in_window))
+            values.append(comp.data[np.ix_(*selection)].ravel())
+
+        if not values:
+            return np.zeros(0)
+        return np.concatenate(values)
+
+    def color_limits(self, frames, percentiles=(0, 100), memory=0):
+        """Return the limits of the color scale that are good for all the
+        ``frames``.
+
+        The data of each frame is read once, but it is not resampled: we look
+        at the values of all the components (and refinement levels) in the
+        plotting window. With the default ``percentiles``, the limits are
+        the minimum and the maximum. Otherwise, they are estimated from a
+        random sample of at most ``CLIM_SAMPLES`` values. The absolute value
+        and the logarithm are applied as in the plot. Frames that are in the
+        frame cache are not read again: their resampled values are used.
+
+        Up to ``memory`` bytes of the data read are kept in ``preloaded``,
+        so that they do not have to be read again for rendering.
+
+        :param frames: Frames that will be rendered.
+        :type frames: list of Frame
+        :param percentiles: Percentiles of the values to use as limits.
+        :type percentiles: tuple of two floats
+        :param memory: Maximum size in bytes of the data to keep.
+        :type memory: int
+
+        :returns: Minimum and maximum of the color scale (None if there are
+                  no valid values).
+        :rtype: tuple of floats
+        """
+        low, high = percentiles
+        exact = low == 0 and high == 100
+        samples_per_frame = max(100, CLIM_SAMPLES // max(len(frames), 1))
+        rng = np.random.default_rng(0)
+
+        vmin, vmax = np.inf, -np.inf
+        samples = []
+        preloaded_size = 0
+
+        for frame in frames:
+            logger.debug(f"Computing color limits at iteration {frame.iteration}")
+            cached = self.cached_frame(frame.iteration)
+            if cached is not None:
+                data = None
+                values = cached.data.ravel()
+            else:
+                data = self.read(frame.iteration)
+                values = self.values_in_window(data)
+
+            if self.args.logscale:
+                # As in plot_color, non positive values are masked
+                values = np.log10(values[values > 0])
+            values = values[np.isfinite(values)]
+
+            if values.size > 0:
+                vmin = min(vmin, values.min())
+                vmax = max(vmax, values.max())
+                if not exact:
+                    if values.size > samples_per_frame:
+                        values = rng.choice(
+                            values, samples_per_frame, replace=False
+                        )
+                    samples.append(values)
+
+            if data is None:
+                continue
+            size = sum(comp.data.nbytes for _, _, comp in data.iter_from_finest())
+            if preloaded_size + size <= memory:
+                self.preloaded[frame.iteration] = data
+                preloaded_size += size
+
+        logger.debug(
+            f"Kept {len(self.preloaded)} frames ({preloaded_size} bytes) in memory"
+        )
+
+        if vmin > vmax:
+            return None, None
+
+        if not exact:
+            vmin, vmax = np.percentile(np.concatenate(samples), [low, high])
+
+        return float(vmin), float(vmax)
+
+    def cache_key(self, iteration):
+        """Return the key of the frame at the given iteration in the cache."""
+        return FrameCache.key(
+            self.args.datadir,
+            self.args.variable,
+            self.args.plane,
+            self.x0,
+            self.x1,
+            self.shape,
+            iteration,
+            self.args.absolute,
+            self.args.multilinear_interpolate,
+        )
+
+    def cached_frame(self, iteration):
+        """Return the resampled data at the given iteration if it is in the
+        cache, otherwise None."""
+        if self.cache is None:
+            return None
+        return self.cache.get(
+            self.cache_key(iteration), self.x0, self.x1, self.shape
+        )
+
+    def resample(self, iteration):
+        """Return the data at the given iteration resampled on the plotting
+        grid, and the original data.
+
+        If the resampled data is found in the cache, the original data is
+        not read and None is returned in its place (unless it was already
+        read by :py:meth:`color_limits`).
+        """
+        x0, x1, shape = self.x0, self.x1, self.shape
+
+        if self.cache is not None:
+            key = self.cache_key(iteration)
+            resampled = self.cache.get(key, x0, x1, shape)
+            if resampled is not None:
+                # Data read by color_limits is not needed anymore (except for
+                # the grid structure)
+                return resampled, self.preloaded.pop(iteration, None)
+
+        data = self.read(iteration)
+
+        logger.debug("Resampling")
+        resampled = data.to_UniformGridData(
+            shape=shape, x0=x0, x1=x1, resample=self.args.multilinear_interpolate
+        )
+
+        if self.cache is not None:
+            self.cache.put(key, resampled)
+
+        return resampled, data
+
+    def render(self, frame):
+        logger.debug(f"Using iteration {frame.iteration} (time = {frame.time})")
+
+        logger.debug(
+            f"Plotting on grid with x0 = {self.x0}, x1 = {self.x1}, shape = {self.shape}"
+        )
+        logger.debug(f"Using label {self.label}")
+
+        if self.args.reuse_figure:
+            return self.render_on_same_figure(frame)
+        return self.render_on_new_figure(frame)
+
+    def render_on_new_figure(self, frame):
+        args = self.args
+        x0, x1 = self.x0, self.x1
+
+        plt.close("all")
+
+        resampled, data = self.resample(frame.iteration)
+
+        logger.debug("Plotting")
+        plt.tight_layout()
+
+        # The field
+        fig, ax = plt.subplots()
+        plot_color(
+            resampled,
+            xlabel=rf"${args.plane[0]}$",
+            ylabel=rf"${args.plane[1]}$",
+            colorbar=args.colorbar,
+            logscale=args.logscale,
+            vmin=args.vmin,
+            vmax=args.vmax,
+            label=self.label,
+            interpolation=args.interpolation_method,
+            cmap=args.colormap,
+            figure=fig,
+            axis=ax
+        )
+
+        # The puncture
+        ax.plot(frame.punctures_x, frame.punctures_y, marker="o", markerfacecolor="black", markeredgecolor="black", markersize=10, linestyle="None")
+
+        add_text_to_corner(fr"$t = {frame.time:.3f}$", figure=fig, axis=ax)
+
+        self.plot_horizons_and_grid(data, frame.iteration)
+
+        set_axis_limits(xmin=x0[0], xmax=x1[0], ymin=x0[1], ymax=x1[1])
+
+        logger.debug("Plotted")
+
+        return self.save(frame, fig, ax)
+
+    def render_on_same_figure(self, frame):
+        args = self.args
+        x0, x1 = self.x0, self.x1
+
+        resampled, data = self.resample(frame.iteration)
+
+        if self.fig is None:
+            logger.debug("Preparing figure")
+            plt.close("all")
+            self.fig, self.ax = plt.subplots()
+            self.image = plot_color(
+                resampled,
+                xlabel=rf"${args.plane[0]}$",
+                ylabel=rf"${args.plane[1]}$",
+                colorbar=args.colorbar,
+                logscale=args.logscale,
+                vmin=args.vmin,
+                vmax=args.vmax,
+                label=self.label,
+                interpolation=args.interpolation_method,
+                cmap=args.colormap,
+                figure=self.fig,
+                axis=self.ax
+            )
+            (self.punctures,) = self.ax.plot(frame.punctures_x, frame.punctures_y, marker="o", markerfacecolor="black", markeredgecolor="black", markersize=10, linestyle="None")
+            self.time_text = add_text_to_corner(
+                fr"$t = {frame.time:.3f}$", figure=self.fig, axis=self.ax
+            )
+            set_axis_limits(xmin=x0[0], xmax=x1[0], ymin=x0[1], ymax=x1[1])
+        else:
+            logger.debug("Updating figure")
+            # Same as what plot_color does with the data
+            image_data = resampled.data_xyz
+            if args.logscale:
+                image_data = np.ma.log10(image_data)
+            vmin = image_data.min() if args.vmin is None else args.vmin
+            vmax = image_data.max() if args.vmax is None else args.vmax
+            self.image.set_data(np.clip(image_data, vmin, vmax))
+            self.image.set_clim(vmin, vmax)
+
+            self.punctures.set_data(frame.punctures_x, frame.punctures_y)
+            self.time_text.set_text(fr"$t = {frame.time:.3f}$")
+
+        for artist in self.frame_artists:
+            artist.remove()
+        artists_before = set(self.ax.get_children())
+        self.plot_horizons_and_grid(data, frame.iteration)
+        self.frame_artists = [
+            artist
+            for artist in self.ax.get_children()
+            if artist not in artists_before
+        ]
+
+        logger.debug("Plotted")
+
+        return self.save(frame, self.fig, self.ax)
+
+    def plot_horizons_and_grid(self, data, iteration):
+        """Plot the apparent horizons and the grid structure, as requested.
+
+        ``data`` is only used for the grid structure. If it is None (because
+        the frame was read from the cache), it is read again.
+        """
+        args = self.args
+
+        if args.ah_show:
+            for ah in self.sim.horizons.available_apparent_horizons:
+                logger.debug(f"Plotting apparent horizon {ah}")
+                plot_horizon_on_plane_at_iteration(
+                    self.sim.horizons.get_apparent_horizon(ah),
+                    iteration,
+                    args.plane,
+                    color=args.ah_color,
+                    edgecolor=args.ah_edge_color,
+                    alpha=args.ah_alpha,
+                )
+
+        if args.rl_show:
+            logger.debug("Plotting grid structure")
+            if data is None:
+                data = self.var[iteration]
+            plot_components_boundaries(
+                data, edgecolor=args.rl_edge_color, alpha=args.rl_alpha
+            )
+
+    def save(self, frame, fig, ax):
+        """Save the frame to a file, or return its pixels as an array with
+        shape (height, width, 4) when making a video."""
+        if self.args.video is not None:
+            logger.debug("Drawing")
+            fig.canvas.draw()
+            # The canvas is reused for the next frame, so we need a copy
+            return np.array(fig.canvas.buffer_rgba())
+
+        logger.debug("Saving")
+        save_from_dir_filename_ext(
+            self.args.outdir,
+            self.figname + "_" + str(frame.number).zfill(4),
+            self.args.fig_extension,
+            tikz_clean_figure=self.args.tikz_clean_figure,
+            figure=fig,
+            axis=ax
+        )
+
+
+# FrameRenderer of each worker process, set by init_worker
+_worker_renderer = None
+
+
+def init_worker(args, figname):
+    """Prepare a worker process to render frames.
+
+    Each worker has its own SimDir, and uses the non-interactive Agg backend.
+    """
+    global _worker_renderer
+
+    matplotlib.use("Agg")
+    setup_matplotlib(params=matplotlib_params(args))
+
+    # Only the main process updates the cache
+    sim = open_simdir(args, save_at_exit=False)
+    var = sim.gridfunctions[args.plane][args.variable]
+    _worker_renderer = FrameRenderer(sim, var, args, figname)
+
+
+def render_in_worker(frame):
+    return _worker_renderer.render(frame)
+
+
 if __name__ == "__main__":
     desc = f"""\
 {kah.get_program_name()} plot a given grid function.
@@ -115,25 +653,109 @@ This is much faster but it is not as accurate."""
         default=20,
         type=int,
     )
+    parser.add_argument(
+        "--tmin",
+        type=float,
+        help="Do not render frames before this time.",
+    )
+    parser.add_argument(
+        "--tmax",
+        type=float,
+        help="Do not render frames after this time.",
+    )
+    parser.add_argument(
+        "--every",
+        default=1,
+        type=int,
+        help="Render only one frame every this many (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--auto-clim",
+        action="store_true",
+        help="Read all the frames before rendering to find a color scale"
+        " that is the same for all of them (unless --vmin and --vmax are"
+        " given).",
+    )
+    parser.add_argument(
+        "--clim-percentiles",
+        nargs=2,
+        default=[0, 100],
+        type=float,
+        help="Percentiles of the values used as limits of the color scale"
+        " with --auto-clim (default: minimum and maximum).",
+    )
+    parser.add_argument(
+        "--clim-memory",
+        default=1024,
+        type=float,
+        help="Maximum memory in MB used to keep the data read with"
+        " --auto-clim for rendering, when --jobs is 1"
+        " (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--time-tolerance",
+        type=float,
+        help="Maximum difference between the time of the punctures and of"
+        " the grid data to consider them the same frame (default: a"
+        " thousandth of the smallest time step of the grid data).",
+    )
+    parser.add_argument(
+        "--reuse-figure",
+        action="store_true",
+        help="Build the figure once and only update the data, the punctures,"
+        " and the labels for each frame. Much faster when the data is small.",
+    )
+    parser.add_argument(
+        "--frame-cache",
+        type=str,
+        help="Directory where to store the data resampled on the plotting"
+        " grid, so that rendering the same frames again (e.g., with a"
+        " different colormap or color limits) does not read the simulation"
+        " files. Entries are not invalidated when the simulation changes.",
+    )
+    parser.add_argument(
+        "--frame-cache-size",
+        default=1024,
+        type=float,
+        help="Maximum size of the frame cache in MB, least recently used"
+        " frames are deleted above this (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--video",
+        type=str,
+        help="Encode all the frames into this video file with ffmpeg instead"
+        " of saving one image per frame.",
+    )
+    parser.add_argument(
+        "--fps",
+        default=25,
+        type=float,
+        help="Frames per second of the video (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--codec",
+        default="libx264",
+        type=str,
+        help="Codec used by ffmpeg for the video (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--ffmpeg",
+        default="ffmpeg",
+        type=str,
+        help="ffmpeg executable (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of processes used to render the frames"
+        " (default: %(default)s)",
+    )
     args = kah.get_args(parser)
 
     # Parse arguments
 
-    custom_matplotlib_params = {
-        'mathtext.fontset' : 'cm',
-        'font.family' : 'Latin Modern Roman',
-        'font.size' : args.font_size,
-        'axes.labelsize' : args.font_size,
-        'xtick.labelsize' : args.font_size,
-        'ytick.labelsize' : args.font_size,
-        'figure.figsize' : [10, 8]
-    }
-    setup_matplotlib(params=custom_matplotlib_params)
-
-    x0, x1, res = args.origin, args.corner, args.resolution
-    shape = [res, res]
-
-    logger = logging.getLogger(__name__)
+    setup_matplotlib(params=matplotlib_params(args))
 
     if args.verbose:
         logging.basicConfig(format="%(asctime)s - %(message)s")
@@ -141,129 +763,76 @@ This is much faster but it is not as accurate."""
 
     figname = get_figname(args, default=f"{args.variable}_{args.plane}")
 
-    logger.debug(f"Reading variable {args.variable}")
-    with SimDir(
-        args.datadir,
-        ignore_symlinks=args.ignore_symlinks,
-        pickle_file=args.pickle_file,
-    ) as sim:
-
-        logger.debug("Prepared SimDir")
-        reader = sim.gridfunctions[args.plane]
-        logger.debug(f"Variables available {reader}")
-        var = reader[args.variable]
-        logger.debug(f"Read variable {args.variable}")
-
-        logger.debug("Reading puncture positional data")
-        puncture_1_x = sim.timeseries.scalar["pt_loc_x[0]"]
-        puncture_1_y = sim.timeseries.scalar["pt_loc_y[0]"]
-
-        puncture_2_x = sim.timeseries.scalar["pt_loc_x[1]"]
-        puncture_2_y = sim.timeseries.scalar["pt_loc_y[1]"]
-
-        # independent counter that keeps track of how many frames we have actually produced
-        j = 0
-
-        for i in range(0, puncture_1_x.t.size):
-            plt.close("all")
-            
-            time = puncture_1_x.t[i]
-
-            # Make sure that the puncture and field data exist at this time
-            if time not in var.available_times:
-                continue
-            iteration = var.iteration_at_time(time)
-        
-            punctures_x = [
-                puncture_1_x.y[i],
-                puncture_2_x.y[i]
-            ]
-
-            punctures_y = [
-                puncture_1_y.y[i],
-                puncture_2_y.y[i]
-            ]
-
-            logger.debug(f"Using iteration {iteration} (time = {time})")
-
-            logger.debug(
-                f"Plotting on grid with x0 = {x0}, x1 = {x1}, shape = {shape}"
-            )
-
-            if args.absolute:
-                data = abs(var[iteration])
-                variable = f"abs({args.variable})"
-            else:
-                data = var[iteration]
-                variable = args.variable
-
-            if args.logscale:
-                label = f"log10({variable})"
-            else:
-                label = variable
-
-            logger.debug(f"Using label {label}")
-
-            logger.debug("Resampling and plotting")
-            plt.tight_layout()
+    if args.every < 1:
+        raise ValueError("--every has to be a positive integer")
 
-            # The field
-            fig, ax = plt.subplots()
-            plot_color(
-                data,
-                x0=x0,
-                x1=x1,
-                shape=shape,
-                xlabel=rf"${args.plane[0]}$",
-                ylabel=rf"${args.plane[1]}$",
-                resample=args.multilinear_interpolate,
-                colorbar=args.colorbar,
-                logscale=args.logscale,
-                vmin=args.vmin,
-                vmax=args.vmax,
-                label=label,
-                interpolation=args.interpolation_method,
-                cmap=args.colormap,
-                figure=fig,
-                axis=ax
-            )
+    if args.reuse_figure and args.tikz_clean_figure:
+        # tikzplotlib.clean_figure modifies the figure, so we cannot reuse it
+        logger.debug("Not reusing the figure because of --tikz-clean-figure")
+        args.reuse_figure = False
 
-            # The puncture
-            ax.plot(punctures_x, punctures_y, marker="o", markerfacecolor="black", markeredgecolor="black", markersize=10, linestyle="None")
-
-            add_text_to_corner(fr"$t = {time:.3f}$", figure=fig, axis=ax)
-
-            if args.ah_show:
-                for ah in sim.horizons.available_apparent_horizons:
-                    logger.debug(f"Plotting apparent horizon {ah}")
-                    plot_horizon_on_plane_at_iteration(
-                        sim.horizons.get_apparent_horizon(ah),
-                        iteration,
-                        args.plane,
-                        color=args.ah_color,
-                        edgecolor=args.ah_edge_color,
-                        alpha=args.ah_alpha,
-                    )
-
-            if args.rl_show:
-                logger.debug("Plotting grid structure")
-                plot_components_boundaries(
-                    data, edgecolor=args.rl_edge_color, alpha=args.rl_alpha
+    logger.debug(f"Reading variable {args.variable}")
+    # Not used as a context manager: SimDir.__exit__ would save it to
+    # its pickle_file, overwriting a pickle that simdir_cache does not own
+    sim = open_simdir(args)
+    logger.debug("Prepared SimDir")
+    reader = sim.gridfunctions[args.plane]
+    logger.debug(f"Variables available {reader}")
+    var = reader[args.variable]
+    logger.debug(f"Read variable {args.variable}")
+
+    frames = select_frames(
+        sim,
+        var,
+        args.time_tolerance,
+        tmin=args.tmin,
+        tmax=args.tmax,
+        every=args.every,
+    )
+    renderer = FrameRenderer(sim, var, args, figname)
+
+    if args.auto_clim and (args.vmin is None or args.vmax is None):
+        # The workers cannot use the data read here
+        memory = args.clim_memory * 1024**2 if args.jobs == 1 else 0
+        vmin, vmax = renderer.color_limits(
+            frames, args.clim_percentiles, memory
+        )
+        logger.debug(f"Color limits from the data: {vmin}, {vmax}")
+        if args.vmin is None:
+            args.vmin = vmin
+        if args.vmax is None:
+            args.vmax = vmax
+
+    logger.debug(f"Rendering {len(frames)} frames")
+
+    if args.video is not None:
+        logger.debug(f"Encoding video {args.video}")
+        video = VideoWriter(
+            args.video, args.fps, ffmpeg=args.ffmpeg, codec=args.codec
+        )
+    else:
+        video = contextlib.nullcontext()
+
+    with video, contextlib.ExitStack() as stack:
+        if args.jobs > 1:
+            executor = stack.enter_context(
+                ProcessPoolExecutor(
+                    max_workers=args.jobs,
+                    initializer=init_worker,
+                    initargs=(args, figname),
                 )
-
-            set_axis_limits(xmin=x0[0], xmax=x1[0], ymin=x0[1], ymax=x1[1])
-
-            logger.debug("Plotted")
-
-            logger.debug("Saving")
-            save_from_dir_filename_ext(
-                args.outdir,
-                figname + "_" + str(j).zfill(4),
-                args.fig_extension,
-                tikz_clean_figure=args.tikz_clean_figure,
-                figure=fig,
-                axis=ax
             )
-            j += 1
-            
-        logger.debug("DONE")
+            # The frame numbers are fixed in advance, so the order in
+            # which the frames are completed does not matter for files.
+            # map returns the results in order, as needed by the video.
+            rendered = executor.map(render_in_worker, frames)
+        else:
+            rendered = (renderer.render(frame) for frame in frames)
+
+        # We consume the iterator to propagate the errors. Frames are
+        # encoded in a separate thread while the next ones are rendered.
+        for image in rendered:
+            if args.video is not None:
+                video.write(image)
+
+    logger.debug("DONE")
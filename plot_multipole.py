@@ -22,7 +22,6 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 
 from kuibit import argparse_helper as kah
-from kuibit.simdir import SimDir
 from kuibit.visualize_matplotlib import (
     add_text_to_corner,
     get_figname,
@@ -33,6 +32,9 @@ from kuibit.visualize_matplotlib import (
 
 import numpy as np
 
+import decimate
+import simdir_cache
+
 if __name__ == "__main__":
     setup_matplotlib()
 
@@ -92,6 +94,14 @@ Scalar field as measured by a given radius and at a given l and m."""
         default=0,
         help="Multipole number m."
     )
+    parser.add_argument(
+        "--decimate",
+        type=int,
+        default=decimate.DEFAULT_BUCKETS,
+        help="Only plot the minimum and maximum of the data in this many"
+        " buckets (e.g., 2000), which looks the same but is much faster for"
+        " long timeseries. 0 to plot all the points. Default: %(default)s",
+    )
 
     args = kah.get_args(parser)
 
@@ -109,7 +119,11 @@ Scalar field as measured by a given radius and at a given l and m."""
     )
     logger.debug(f"Using figname {figname}")
 
-    sim = SimDir(args.datadir, ignore_symlinks=args.ignore_symlinks)
+    sim = simdir_cache.load_simdir(
+        args.datadir,
+        ignore_symlinks=args.ignore_symlinks,
+        pickle_file=args.pickle_file,
+    )
 
     logger.debug("Prepared SimDir")
 
@@ -151,17 +165,26 @@ Scalar field as measured by a given radius and at a given l and m."""
     plt.tick_params(axis="both", which="major", labelsize=font_size)
 
     if args.plot_log_of_abs:
-        plt.plot(np.log(phi.abs()), color="black")        
+        plt.plot(
+            decimate.decimate_timeseries(
+                np.log(phi.abs()), args.decimate, args.xmin, args.xmax
+            ),
+            color="black",
+        )        
         plt.ylabel(fr"$\left| \Phi_{{{args.mult_l}{args.mult_m}}}(r,t) \right|$", fontsize = font_size)
     else:
         plt.plot(
-            phi.real(),
+            decimate.decimate_timeseries(
+                phi.real(), args.decimate, args.xmin, args.xmax
+            ),
             color="black",
             label=fr"$\Re \left( \Phi_{{{args.mult_l}{args.mult_m}}} \right)$"
         )
         
         plt.plot(
-            phi.imag(),
+            decimate.decimate_timeseries(
+                phi.imag(), args.decimate, args.xmin, args.xmax
+            ),
             color="red",
             label=fr"$\Im \left( \Phi_{{{args.mult_l}{args.mult_m}}} \right)$",
         )
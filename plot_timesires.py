@@ -16,13 +16,17 @@
 # You should have received a copy of the GNU General Public License along with
 # this program; if not, see <https://www.gnu.org/licenses/>.
 
+import itertools
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
+import numpy as np
 
 from kuibit import argparse_helper as kah
-from kuibit.simdir import SimDir
 from kuibit.visualize_matplotlib import (
     get_figname,
     save_from_dir_filename_ext,
@@ -30,6 +34,116 @@ from kuibit.visualize_matplotlib import (
     setup_matplotlib,
 )
 
+import decimate
+import simdir_cache
+from scalar_follow import AsciiFollower, find_scalar_file, line_start
+
+logger = logging.getLogger(__name__)
+
+
+def read_timeseries(sim, variables, reductions, jobs=1):
+    """Return the timeseries of all the ``variables`` with all the
+    ``reductions``, as a list of (variable, reduction, timeseries).
+
+    The files are read concurrently by ``jobs`` threads.
+    """
+    combinations = list(itertools.product(reductions, variables))
+
+    # The readers are prepared here, so that the threads only read the data
+    readers = {}
+    for reduction, variable in combinations:
+        if reduction not in readers:
+            readers[reduction] = sim.timeseries[reduction]
+            logger.debug(f"Available variables {readers[reduction]}")
+        if variable not in readers[reduction]:
+            raise ValueError(f"{variable} not available with reduction {reduction}")
+
+    def read(combination):
+        reduction, variable = combination
+        logger.debug(f"Reading variable {variable} ({reduction})")
+        return variable, reduction, readers[reduction][variable]
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(read, combinations))
+
+
+def num_buckets(args):
+    """Return the number of buckets used to decimate the timeseries.
+
+    Buckets have the same number of points, so they do not have the same
+    width with a logarithmic x axis, and the timeseries are not decimated.
+    """
+    return 0 if args.logxaxis else args.decimate
+
+
+def follow(args, fig, axes, lines, all_timeseries, followers, save):
+    """Update the plot with the data appended to the files, every
+    ``args.interval`` seconds, until interrupted.
+
+    ``lines`` are the plotted lines, and ``followers`` the
+    :py:class:`~.AsciiFollower` of the corresponding timeseries in
+    ``all_timeseries`` (None for the ones that are not followed). Only the
+    new rows are read, and the rows that were already in the timeseries are
+    discarded. ``save`` is called after each update to save the figure (or
+    None, when the figure is shown).
+    """
+    times = [var.t for _, _, var in all_timeseries]
+    values = [var.y for _, _, var in all_timeseries]
+
+    logger.debug(f"Following the data every {args.interval} seconds")
+
+    try:
+        while True:
+            if save is None:
+                plt.pause(args.interval)
+            else:
+                time.sleep(args.interval)
+
+            updated = False
+            for index, follower in enumerate(followers):
+                if follower is None:
+                    continue
+                new_t, new_y = follower.read()
+                if len(times[index]) > 0:
+                    is_new = new_t > times[index][-1]
+                    new_t, new_y = new_t[is_new], new_y[is_new]
+                if len(new_t) == 0:
+                    continue
+
+                logger.debug(f"Read {len(new_t)} new rows from {follower.path}")
+                times[index] = np.concatenate([times[index], new_t])
+                values[index] = np.concatenate([values[index], new_y])
+                lines[index].set_data(
+                    *decimate.decimate(
+                        times[index],
+                        values[index],
+                        num_buckets(args),
+                        args.xmin,
+                        args.xmax,
+                    )
+                )
+                updated = True
+
+            if not updated:
+                continue
+
+            for ax in set(axes):
+                ax.relim()
+                ax.autoscale_view()
+                set_axis_limits_from_args(args, figure=fig, axis=ax)
+
+            if save is None:
+                fig.canvas.draw_idle()
+            else:
+                save()
+    except KeyboardInterrupt:
+        logger.debug("Stopped following")
+    finally:
+        for follower in followers:
+            if follower is not None:
+                follower.close()
+
+
 if __name__ == "__main__":
     setup_matplotlib()
 
@@ -56,7 +170,11 @@ if __name__ == "__main__":
     )
 
     parser.add_argument(
-        "--variable", type=str, required=True, help="Variable to plot."
+        "--variable",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Variable(s) to plot."
     )
     parser.add_argument(
         "--reduction",
@@ -70,8 +188,44 @@ if __name__ == "__main__":
             "average",
             "infnorm",
         ],
-        default="scalar",
-        help="Reduction to plot.",
+        nargs="+",
+        default=["scalar"],
+        help="Reduction(s) to plot. All the variables are plotted with all"
+        " the reductions.",
+    )
+    parser.add_argument(
+        "--tile",
+        action="store_true",
+        help="Plot each timeseries in its own panel instead of overlaying"
+        " them.",
+    )
+    parser.add_argument(
+        "--decimate",
+        type=int,
+        default=decimate.DEFAULT_BUCKETS,
+        help="Only plot the minimum and maximum of the data in this many"
+        " buckets (e.g., 2000), which looks the same but is much faster for"
+        " long timeseries. Ignored with --logxaxis. 0 to plot all the"
+        " points. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep reading the data appended to the most recent files (e.g.,"
+        " of a running simulation) and update the plot (or save it again)"
+        " until interrupted with Ctrl-C.",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=10,
+        help="Seconds between updates with --follow. Default: %(default)s",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Number of threads used to read the data. Default: 4",
     )
     parser.add(
         "--logxaxis", help="Use a logarithmic x axis.", action="store_true"
@@ -81,30 +235,60 @@ if __name__ == "__main__":
     )
     args = kah.get_args(parser)
 
-    logger = logging.getLogger(__name__)
-
     if args.verbose:
         logging.basicConfig(format="%(asctime)s - %(message)s")
         logger.setLevel(logging.DEBUG)
 
-    if args.reduction == "scalar":
-        ext = ""
-        red = ""
-    else:
-        ext = "_"
-        red = args.reduction
+    # The scalars have no reduction in the name
+    reductions = "_".join(
+        reduction for reduction in args.reduction if reduction != "scalar"
+    )
+    ext = "_" if reductions else ""
 
-    figname = get_figname(args, default=f"{args.variable}{ext}{red}")
+    figname = get_figname(
+        args, default=f"{'_'.join(args.variable)}{ext}{reductions}"
+    )
     logger.debug(f"Using figname {figname}")
 
-    logger.debug(f"Reading variable {args.variable}")
-    sim = SimDir(args.datadir, ignore_symlinks=args.ignore_symlinks)
+    logger.debug(f"Reading variables {args.variable}")
+    sim = simdir_cache.load_simdir(
+        args.datadir,
+        ignore_symlinks=args.ignore_symlinks,
+        pickle_file=args.pickle_file,
+    )
 
     logger.debug("Prepared SimDir")
-    reader = sim.timeseries[args.reduction]
-    logger.debug(f"Available variables {reader}")
-    var = reader[args.variable]
-    logger.debug(f"Read variable {args.variable}")
+
+    if args.follow:
+        # We take the size of the files before reading the data, so that
+        # nothing written after is lost. Timeseries that cannot be followed
+        # are only plotted.
+        followed_files = []
+        for reduction, variable in itertools.product(
+            args.reduction, args.variable
+        ):
+            try:
+                path, time_column, data_column = find_scalar_file(
+                    sim.timeseries[reduction], variable
+                )
+            except ValueError as exce:
+                logger.warning(
+                    f"{exce}, {variable} ({reduction}) will not be updated"
+                )
+                followed_files.append(None)
+                continue
+            followed_files.append(
+                (path, time_column, data_column, os.path.getsize(path))
+            )
+
+        if all(followed is None for followed in followed_files):
+            logger.warning("No timeseries can be followed")
+            args.follow = False
+
+    all_timeseries = read_timeseries(
+        sim, args.variable, args.reduction, args.jobs
+    )
+    logger.debug(f"Read {len(all_timeseries)} timeseries")
 
     logger.debug("Plotting timeseries")
 
@@ -113,33 +297,83 @@ if __name__ == "__main__":
     mpl.rcParams['mathtext.fontset'] = 'cm'
     mpl.rcParams['font.family'] = 'Latin Modern Roman'
     plt.rcParams['figure.figsize'] = [10, 8]
-    
-    plt.plot(var, color="black")
-    plt.xlabel("Simulation time", fontsize=font_size)
-    plt.ylabel(f"{red} {args.variable}", fontsize=font_size)
 
-    plt.tick_params(axis="both", which="major", labelsize=font_size)
+    if args.tile:
+        fig, axes = plt.subplots(
+            len(all_timeseries),
+            1,
+            sharex=True,
+            squeeze=False,
+            figsize=[10, max(8, 3 * len(all_timeseries))],
+        )
+        axes = axes[:, 0]
+    else:
+        fig, ax = plt.subplots()
+        axes = [ax] * len(all_timeseries)
+
+    lines = []
+    for ax, (variable, reduction, var) in zip(axes, all_timeseries):
+        var = decimate.decimate_timeseries(
+            var, num_buckets(args), args.xmin, args.xmax
+        )
+        red = "" if reduction == "scalar" else reduction
+        label = f"{red} {variable}"
+        if len(all_timeseries) == 1 or args.tile:
+            (line,) = ax.plot(var, color="black")
+            ax.set_ylabel(label, fontsize=font_size)
+        else:
+            (line,) = ax.plot(var, label=label)
+        lines.append(line)
 
-    if args.logxaxis:
-        plt.xscale("log")
-    if args.logyaxis:
-        plt.yscale("log")
+    if len(all_timeseries) > 1 and not args.tile:
+        axes[0].legend()
 
-    set_axis_limits_from_args(args)
+    axes[-1].set_xlabel("Simulation time", fontsize=font_size)
+
+    for ax in set(axes):
+        ax.tick_params(axis="both", which="major", labelsize=font_size)
+
+        if args.logxaxis:
+            ax.set_xscale("log")
+        if args.logyaxis:
+            ax.set_yscale("log")
+
+        set_axis_limits_from_args(args, figure=fig, axis=ax)
 
     logger.debug("Plotted")
 
-    logger.debug("Saving")
+    def save():
+        logger.debug("Saving")
+        save_from_dir_filename_ext(
+            args.outdir,
+            figname,
+            args.fig_extension,
+            figure=fig,
+        )
 
     if args.save_fig:
-      logger.debug("Saving")
-      save_from_dir_filename_ext(
-          args.outdir,
-          figname,
-          args.fig_extension
-      )
-    else:
+        save()
+    elif not args.follow:
         logger.debug("Showing plot")
         plt.show()
-    
+
+    if args.follow:
+        followers = [
+            None
+            if followed is None
+            else AsciiFollower(
+                *followed[:3], offset=line_start(followed[0], followed[3])
+            )
+            for followed in followed_files
+        ]
+        follow(
+            args,
+            fig,
+            axes,
+            lines,
+            all_timeseries,
+            followers,
+            save if args.save_fig else None,
+        )
+
     logger.debug("DONE")
@@ -1,10 +1,50 @@
+import csv
+import glob
+import json
 import os
+
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from scipy import signal
 from scipy.signal import savgol_filter
 
+import data_loader
+import decimate
+import spectral
+
+PEAK_FIELDS = ["file", "column", "samples", "dt", "rank", "frequency", "omega", "value"]
+
+def peak_record(file_path, column, num_points, dt, rank, frequency, value):
+    return dict(
+        zip(
+            PEAK_FIELDS,
+            [
+                file_path,
+                int(column),
+                int(num_points),
+                float(dt),
+                int(rank),
+                float(frequency),
+                float(frequency * 2.0 * np.pi),
+                float(value),
+            ],
+        )
+    )
+
+def write_peaks(path, records):
+    """Write the peaks to path, as JSON if the extension is .json, otherwise
+    as CSV. Missing peaks (NaN) are skipped."""
+    records = [record for record in records if not np.isnan(record["value"])]
+    if os.path.splitext(path)[1] == ".json":
+        with open(path, "w") as peaks_file:
+            json.dump(records, peaks_file, indent=2)
+    else:
+        with open(path, "w", newline="") as peaks_file:
+            writer = csv.DictWriter(peaks_file, fieldnames=PEAK_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+
 def plot(arguments):
     x_axis = int(arguments["<x_axis>"])
     y_axis = int(arguments["<y_axis>"])
@@ -13,7 +53,6 @@ def plot(arguments):
     y_label = arguments["--ylabel"]
 
     file_path = arguments["<file>"]
-    file_extension = os.path.splitext(file_path)[1]
     
     save = arguments["--save"]
 
@@ -22,14 +61,9 @@ def plot(arguments):
     else:
         style = "o"
 
-    if file_extension == ".npy" or file_extension == ".npz":
-        data = np.load(file_path)
-        xData = data[:, x_axis]
-        yData = data[:, y_axis]
-    else:
-        data = np.loadtxt(file_path, usecols=[x_axis, y_axis])
-        xData = data[:, 0]
-        yData = data[:, 1]
+    xData, yData = data_loader.load_columns(
+        file_path, [x_axis, y_axis], npz_key=arguments["--npz-key"]
+    )
 
     font_size = 30
     mpl.rcParams['mathtext.fontset'] = 'cm'
@@ -39,10 +73,23 @@ def plot(arguments):
     plt.close('all')
 
     if arguments["--abslog"]:
-        plt.plot(xData, np.abs(yData), style, color='black')
+        yData = np.abs(yData)
+
+    # Only the minimum and maximum of each bucket are plotted. Markers would
+    # disappear, so only lines are decimated.
+    if arguments["--lines"]:
+        xData, yData = decimate.decimate(
+            xData,
+            yData,
+            int(arguments["--decimate"]),
+            xmin=None if arguments["--xmin"] is None else float(arguments["--xmin"]),
+            xmax=None if arguments["--xmax"] is None else float(arguments["--xmax"]),
+        )
+
+    plt.plot(xData, yData, style, color='black')
+
+    if arguments["--abslog"]:
         plt.yscale("log")
-    else:
-        plt.plot(xData, yData, style, color='black')
 
     current_xmin, current_xmax = plt.xlim()
     current_ymin, current_ymax = plt.ylim()
@@ -81,7 +128,6 @@ def fft_plot(arguments):
     y_label = arguments["--ylabel"]
 
     file_path = arguments["<file>"]
-    file_extension = os.path.splitext(file_path)[1]
     
     save = arguments["--save"]
 
@@ -90,31 +136,30 @@ def fft_plot(arguments):
     else:
         style = "-"
 
-    if file_extension == ".npy" or file_extension == ".npz":
-        data = np.load(file_path)
-        xData = data[:, x_axis]
-        yData = data[:, y_axis]
-    else:
-        data = np.loadtxt(file_path, usecols=[x_axis, y_axis])
-        xData = data[:, 0]
-        yData = data[:, 1]
+    xData, yData = data_loader.load_columns(
+        file_path, [x_axis, y_axis], npz_key=arguments["--npz-key"]
+    )
 
     # Time step and sampling frequencies
     dt = xData[1] - xData[0]
     fs = 1/dt
    
-    # Window and trasforms
+    # Window and trasforms. With --positive we only compute the positive
+    # frequencies with a real FFT.
     W = signal.windows.tukey(len(xData), alpha=float(arguments["--alpha"]), sym=True)
-    yBar = np.fft.fft(yData * W)/fs
-    f = np.fft.fftfreq(len(xData), dt)
-
-    yBar = np.fft.fftshift(yBar)
-    f = np.fft.fftshift(f)
+    f, yBar = spectral.spectrum(
+        yData,
+        dt,
+        W,
+        one_sided=arguments["--positive"],
+        workers=int(arguments["--workers"]),
+    )
+    yBar /= fs
 
     if arguments["--positive"]:
-        f_positive = (f > 0)
-        f = f[f_positive]
-        yBar = yBar[f_positive]
+        # Drop the zero frequency
+        f = f[1:]
+        yBar = yBar[1:]
 
     font_size = 30
     mpl.rcParams['mathtext.fontset'] = 'cm'
@@ -164,7 +209,6 @@ def psd_plot(arguments):
     y_label = arguments["--ylabel"]
 
     file_path = arguments["<file>"]
-    file_extension = os.path.splitext(file_path)[1]
     
     save = arguments["--save"]
 
@@ -173,44 +217,61 @@ def psd_plot(arguments):
     else:
         style = "-"
 
-    if file_extension == ".npy" or file_extension == ".npz":
-        data = np.load(file_path)
-        xData = data[:, x_axis]
-        yData = data[:, y_axis]
-    else:
-        data = np.loadtxt(file_path, usecols=[x_axis, y_axis])
-        xData = data[:, 0]
-        yData = data[:, 1]
+    xData, yData = data_loader.load_columns(
+        file_path, [x_axis, y_axis], npz_key=arguments["--npz-key"]
+    )
 
     # Time step
     dt = xData[1] - xData[0]
-    
-    # Transforms and window
-    W = signal.windows.tukey(len(xData), alpha=float(arguments["--alpha"]), sym=True)
-    yBar = np.fft.fft(yData * W)
-    f = np.fft.fftfreq(len(xData), dt)
-
-    yBar = np.fft.fftshift(yBar)
-    f = np.fft.fftshift(f)
 
-    S = np.sum(W**2)
-    PSD = dt/S * np.abs(yBar)**2
+    # With --positive we only compute the positive frequencies with a real FFT
+    # and return the one-sided PSD
+    positive = arguments["--positive"]
+    workers = int(arguments["--workers"])
+
+    if arguments["--welch"]:
+        if arguments["--overlap"] != None:
+            overlap = int(arguments["--overlap"])
+        else:
+            overlap = None
+
+        f, PSD = spectral.welch_psd(
+            yData,
+            dt,
+            int(arguments["--segment"]),
+            overlap,
+            window=arguments["--window"],
+            alpha=float(arguments["--alpha"]),
+            one_sided=positive,
+            workers=workers,
+        )
+    else:
+        # Transforms and window
+        W = signal.windows.tukey(len(xData), alpha=float(arguments["--alpha"]), sym=True)
+        f, PSD = spectral.periodogram(
+            yData, dt, W, one_sided=positive, workers=workers
+        )
 
-    if arguments["--positive"]:
-        f_positive = (f >= 0.0)
-        f = f[f_positive]
-        PSD = PSD[f_positive]
-        PSD = 2 * PSD
-       
     if arguments["--peak"]:
-        peak_val = np.amax(PSD)
-        peak_index = np.where(PSD == peak_val)
+        peak_f, peak_val, _ = spectral.find_peaks(
+            f,
+            PSD,
+            num_peaks=int(arguments["--peaks"]),
+            interpolation=arguments["--peak-interp"],
+        )
         print("Peak values: ", end="")
         print(peak_val)
         print("Peak frequencies: ", end="")
-        print(f[peak_index] * 2.0 * np.pi)
-        print(f[(peak_index[0][0] + 1)] * 2.0 * np.pi)
-        print(f[(peak_index[0][0] - 1)] * 2.0 * np.pi)
+        print(peak_f * 2.0 * np.pi)
+
+        if arguments["--peak-output"] != None:
+            write_peaks(
+                arguments["--peak-output"],
+                [
+                    peak_record(file_path, y_axis, len(xData), dt, rank, frequency, value)
+                    for rank, (frequency, value) in enumerate(zip(peak_f, peak_val))
+                ],
+            )
 
     if arguments["--smooth"] and arguments["--lines"]:
         PSD = savgol_filter(PSD, 21, 3)
@@ -258,3 +319,113 @@ def psd_plot(arguments):
         plt.savefig(save)
     else:
         plt.show()
+
+def batch_spectra(arguments):
+    x_axis = int(arguments["<x_axis>"])
+    y_axes = [int(y_axis) for y_axis in arguments["<y_axes>"].split(",")]
+
+    x_label = arguments["--xlabel"]
+    y_label = arguments["--ylabel"]
+
+    compute_psd = arguments["psd"]
+    positive = arguments["--positive"]
+    alpha = float(arguments["--alpha"])
+    workers = int(arguments["--workers"])
+
+    # The patterns are expanded here too, so that they work when quoted
+    file_paths = []
+    for pattern in arguments["<files>"]:
+        matches = sorted(glob.glob(pattern))
+        file_paths.extend(matches if matches else [pattern])
+
+    # Signals with the same number of points and time step are transformed
+    # together. groups has keys (number of points, dt) and values lists of
+    # (file, column, data)
+    groups = {}
+    for file_path in file_paths:
+        xData, *yColumns = data_loader.load_columns(
+            file_path, [x_axis] + y_axes, npz_key=arguments["--npz-key"]
+        )
+        dt = xData[1] - xData[0]
+        for y_axis, yData in zip(y_axes, yColumns):
+            groups.setdefault((len(xData), dt), []).append(
+                (file_path, y_axis, yData)
+            )
+
+    figures_dir = arguments["--figures"]
+    if figures_dir != None:
+        os.makedirs(figures_dir, exist_ok=True)
+        common_root = os.path.commonpath(
+            [os.path.dirname(os.path.abspath(file_path)) for file_path in file_paths]
+        )
+
+        font_size = 30
+        mpl.rcParams['mathtext.fontset'] = 'cm'
+        mpl.rcParams['font.family'] = 'Latin Modern Roman'
+        plt.rcParams['figure.figsize'] = [10, 8]
+
+        plt.close('all')
+        fig, ax = plt.subplots()
+
+    kind = "psd" if compute_psd else "fft"
+    records = []
+
+    for (num_points, dt), group in groups.items():
+        # Shape (number of signals, number of points)
+        Y = np.stack([np.asarray(yData, dtype=float) for _, _, yData in group])
+        W = signal.windows.tukey(num_points, alpha=alpha, sym=True)
+
+        if compute_psd:
+            f, S = spectral.periodogram(
+                Y, dt, W, one_sided=positive, workers=workers
+            )
+        else:
+            f, yBar = spectral.spectrum(
+                Y, dt, W, one_sided=positive, workers=workers
+            )
+            S = np.abs(yBar) * dt
+            if positive:
+                # Drop the zero frequency, as in fft_plot
+                f = f[1:]
+                S = S[:, 1:]
+
+        peak_f, peak_val, _ = spectral.find_peaks(
+            f,
+            S,
+            num_peaks=int(arguments["--peaks"]),
+            interpolation=arguments["--peak-interp"],
+        )
+
+        for signal_index, (file_path, y_axis, _) in enumerate(group):
+            for rank in range(peak_f.shape[1]):
+                records.append(
+                    peak_record(
+                        file_path,
+                        y_axis,
+                        num_points,
+                        dt,
+                        rank,
+                        peak_f[signal_index, rank],
+                        peak_val[signal_index, rank],
+                    )
+                )
+
+            if figures_dir != None:
+                ax.clear()
+                ax.plot(f, S[signal_index], "-", color='black')
+                ax.set_xlabel(x_label, fontsize=font_size)
+                ax.set_ylabel(y_label, fontsize=font_size)
+                ax.tick_params(axis='both', which='major', labelsize=font_size)
+                fig.tight_layout()
+
+                # The figures mirror the directories of the inputs, so that
+                # files with the same name in different simulation outputs
+                # (output-0000, output-0001, ...) do not overwrite each other
+                name = os.path.splitext(
+                    os.path.relpath(os.path.abspath(file_path), common_root)
+                )[0]
+                figure_path = os.path.join(figures_dir, f"{name}_{y_axis}_{kind}.png")
+                os.makedirs(os.path.dirname(figure_path), exist_ok=True)
+                fig.savefig(figure_path)
+
+    write_peaks(arguments["--table"], records)
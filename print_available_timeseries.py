@@ -16,15 +16,205 @@
 # You should have received a copy of the GNU General Public License along with
 # this program; if not, see <https://www.gnu.org/licenses/>.
 
+import fnmatch
+import json
+import logging
+import os
+import tempfile
+
 from kuibit import argparse_helper as kah
-from kuibit.simdir import SimDir
+
+import simdir_cache
+
+logger = logging.getLogger(__name__)
+
+REDUCTIONS = (
+    "scalar",
+    "minimum",
+    "maximum",
+    "norm1",
+    "norm2",
+    "average",
+    "sum",
+    "infnorm",
+)
+
+DIMENSIONS = ("x", "y", "z", "xy", "xz", "yz", "xyz")
+
+
+def build_catalog(sim):
+    """Return a dictionary with all the data available in ``sim``.
+
+    The keys are:
+
+    - ``timeseries``: variables for each reduction;
+    - ``gridfunctions``: variables for each dimension (x, xy, xyz, ...);
+    - ``multipoles``: for each variable, the radii with their (l, m);
+    - ``horizons``: indices of the apparent horizons and QLM horizons.
+    """
+    catalog = {"path": sim.path}
+
+    logger.debug("Reading timeseries")
+    catalog["timeseries"] = {
+        reduction: sorted(sim.timeseries[reduction].keys())
+        for reduction in REDUCTIONS
+    }
+
+    logger.debug("Reading grid functions")
+    catalog["gridfunctions"] = {
+        dimension: sorted(sim.gridfunctions[dimension].keys())
+        for dimension in DIMENSIONS
+    }
+
+    logger.debug("Reading multipoles")
+    catalog["multipoles"] = {}
+    for name in sorted(sim.multipoles.keys()):
+        reader = sim.multipoles[name]
+        catalog["multipoles"][name] = [
+            {
+                "radius": radius,
+                "available_lm": sorted(
+                    [mult_l, mult_m]
+                    for mult_l, mult_m in reader[radius].available_lm
+                ),
+            }
+            for radius in reader.radii
+        ]
+
+    logger.debug("Reading horizons")
+    catalog["horizons"] = {
+        "apparent": sorted(sim.horizons.available_apparent_horizons),
+        "qlm": sorted(sim.horizons.available_qlm_horizons),
+    }
+
+    return catalog
+
+
+def filter_catalog(catalog, pattern):
+    """Return the ``catalog`` with only the variables that match the shell
+    ``pattern`` (e.g., ``rho*``)."""
+
+    def matching(names):
+        return [name for name in names if fnmatch.fnmatchcase(name, pattern)]
+
+    filtered = dict(catalog)
+    filtered["timeseries"] = {
+        reduction: matching(names)
+        for reduction, names in catalog["timeseries"].items()
+    }
+    filtered["gridfunctions"] = {
+        dimension: matching(names)
+        for dimension, names in catalog["gridfunctions"].items()
+    }
+    filtered["multipoles"] = {
+        name: radii
+        for name, radii in catalog["multipoles"].items()
+        if fnmatch.fnmatchcase(name, pattern)
+    }
+    return filtered
+
+
+def read_cached_catalog(path, datadir, ignore_symlinks):
+    """Return the catalog saved in ``path`` if no file was added to or
+    removed from ``datadir`` since, otherwise None.
+
+    Files that grow (e.g., while the simulation is running) do not change
+    the catalog, which only has the names of the available data."""
+    try:
+        with open(path) as file_:
+            saved = json.load(file_)
+    except (OSError, ValueError):
+        return None
+
+    if not simdir_cache.matches(saved.get("signature", {}), datadir, ignore_symlinks):
+        logger.debug(f"{path} is out of date")
+        return None
+
+    return saved["catalog"]
+
+
+def write_cached_catalog(path, catalog, sim_signature):
+    """Save the ``catalog`` with the signature of the files it describes."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file_:
+            json.dump({"signature": sim_signature, "catalog": catalog}, file_)
+        os.replace(tmp_path, path)
+    except OSError as exce:
+        # We can live without the cache
+        logger.debug(f"Could not save catalog to {path}: {exce}")
+
 
 if __name__ == "__main__":
 
     desc = f"""{kah.get_program_name()} prints the list of timeseries
-    available to kuibit in the given data folder."""
+    available to kuibit in the given data folder.
+
+    With --json, it prints a catalog of the timeseries, grid functions,
+    multipoles, and horizons as JSON. The catalog is cached, and it is read
+    without looking at the data as long as no file is added or removed."""
     parser = kah.init_argparse(desc)
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the catalog of all the available data as JSON.",
+    )
+    parser.add_argument(
+        "--pattern",
+        type=str,
+        help="Only list variables that match this shell pattern (e.g., 'rho*').",
+    )
     args = kah.get_args(parser)
-    sim = SimDir(args.datadir,ignore_symlinks=args.ignore_symlinks)
-    print(sim.timeseries)
 
+    if args.verbose:
+        logging.basicConfig(format="%(asctime)s - %(message)s")
+        logger.setLevel(logging.DEBUG)
+
+    if args.json:
+        catalog_path = (
+            simdir_cache.cache_path(
+                args.datadir, args.ignore_symlinks, args.pickle_file
+            )
+            + ".catalog.json"
+        )
+
+        catalog = read_cached_catalog(
+            catalog_path, args.datadir, args.ignore_symlinks
+        )
+        if catalog is None:
+            sim = simdir_cache.load_simdir(
+                args.datadir,
+                ignore_symlinks=args.ignore_symlinks,
+                pickle_file=args.pickle_file,
+            )
+            # The signature is taken before reading the data, so that files
+            # changed in the meantime invalidate the catalog
+            sim_signature = simdir_cache.signature(sim)
+            catalog = build_catalog(sim)
+            write_cached_catalog(catalog_path, catalog, sim_signature)
+        else:
+            logger.debug(f"Read catalog from {catalog_path}")
+
+        if args.pattern is not None:
+            catalog = filter_catalog(catalog, args.pattern)
+
+        print(json.dumps(catalog, indent=2))
+    else:
+        sim = simdir_cache.load_simdir(
+            args.datadir,
+            ignore_symlinks=args.ignore_symlinks,
+            pickle_file=args.pickle_file,
+        )
+        if args.pattern is None:
+            print(sim.timeseries)
+        else:
+            for reduction in REDUCTIONS:
+                names = [
+                    name
+                    for name in sorted(sim.timeseries[reduction].keys())
+                    if fnmatch.fnmatchcase(name, args.pattern)
+                ]
+                if names:
+                    print(f"{reduction}: {' '.join(names)}")
@@ -0,0 +1,395 @@
+import logging
+
+import numpy as np
+
+import spectral
+
+logger = logging.getLogger(__name__)
+
+# Initial guess for the damping rate, from multipole_fit.jl
+DEFAULT_OMEGA_I = 0.09
+
+# Maximum number of elements of the (start times x samples) arrays. The
+# start times are fitted in chunks that fit in this size.
+CHUNK_ELEMENTS = 2**22
+
+# Fits with fewer points than this are not performed: there are four
+# parameters
+MIN_POINTS = 4
+
+FIT_FIELDS = (
+    "t0",
+    "omega_i",
+    "omega_r",
+    "amplitude",
+    "phase",
+    "residual",
+    "mismatch",
+    "start_residual",
+    "num_points",
+    "iterations",
+    "converged",
+)
+
+
+def qnm_model(t, t0, amplitude, omega_i, omega_r, phase):
+    """Return the damped sinusoid
+    ``amplitude * exp(-omega_i (t - t0)) * cos(omega_r (t - t0) - phase)``.
+
+    This is ``qnm_model`` in multipole_fit.jl, with the amplitude and the
+    phase measured at ``t0`` instead of at ``t = 0``.
+    """
+    tau = np.asarray(t) - t0
+    return amplitude * np.exp(-omega_i * tau) * np.cos(omega_r * tau - phase)
+
+
+def guess_omega_r(t, y):
+    """Return the angular frequency of the highest peak of the periodogram
+    of ``y``, sampled uniformly at times ``t``."""
+    dt = t[1] - t[0]
+    W = spectral.get_window("hann", len(y))
+    f, PSD = spectral.periodogram(y, dt, W, one_sided=True)
+    # The zero frequency is not a QNM
+    frequency, _, _ = spectral.find_peaks(f[1:], PSD[1:])
+    return 2 * np.pi * frequency[0]
+
+
+def solve_2x2(g11, g12, g22, r1, r2):
+    """Solve the symmetric systems ``[[g11, g12], [g12, g22]] x = [r1, r2]``,
+    one for each element of the arrays."""
+    det = g11 * g22 - g12 * g12
+    return (g22 * r1 - g12 * r2) / det, (g11 * r2 - g12 * r1) / det
+
+
+class _Projection:
+    """Linear parameters that best fit the windows for given frequencies,
+    with what is needed to compute the Jacobian, see
+    :py:meth:`_Windows.project`."""
+
+    FIELDS = ("a", "b", "C", "S", "g11", "g12", "g22", "fit", "residual", "cost")
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields[name])
+
+    def take(self, rows):
+        """Return the projection of the given rows only."""
+        return _Projection(
+            **{name: getattr(self, name)[rows] for name in self.FIELDS}
+        )
+
+    def update(self, other, rows):
+        """Replace the given rows with the ones of ``other``."""
+        for name in self.FIELDS:
+            getattr(self, name)[rows] = getattr(other, name)[rows]
+
+
+class _Windows:
+    """Samples of the fits starting at the times ``t0``.
+
+    Each row is the fit window of one start time: the times after the start
+    are measured from it (``tau``), the others are masked.
+    """
+
+    def __init__(self, t, y, t0):
+        mask = t[None, :] >= t0[:, None]
+        self.tau = np.where(mask, t[None, :] - t0[:, None], 0.0)
+        self.mask = mask.astype(float)
+        self.y = self.mask * y[None, :]
+
+    def take(self, rows):
+        """Return the windows of the given rows only."""
+        windows = _Windows.__new__(_Windows)
+        windows.tau = self.tau[rows]
+        windows.mask = self.mask[rows]
+        windows.y = self.y[rows]
+        return windows
+
+    def project(self, omega_i, omega_r):
+        """Return the linear parameters that best fit the data for the given
+        frequencies, and what is needed to compute the Jacobian.
+
+        The model is ``exp(-omega_i tau) (a cos(omega_r tau) + b sin(omega_r
+        tau))``, which is linear in a and b, so they are found by solving the
+        normal equations. This is the variable projection: the nonlinear fit
+        is only on the frequencies.
+
+        :rtype: :py:class:`_Projection`
+        """
+        omega_i = omega_i[:, None]
+        omega_r = omega_r[:, None]
+        damping = np.exp(-omega_i * self.tau) * self.mask
+        C = damping * np.cos(omega_r * self.tau)
+        S = damping * np.sin(omega_r * self.tau)
+
+        g11 = np.sum(C * C, axis=1)
+        g12 = np.sum(C * S, axis=1)
+        g22 = np.sum(S * S, axis=1)
+        a, b = solve_2x2(
+            g11, g12, g22, np.sum(C * self.y, axis=1), np.sum(S * self.y, axis=1)
+        )
+        fit = a[:, None] * C + b[:, None] * S
+        residual = self.y - fit
+        return _Projection(
+            a=a,
+            b=b,
+            C=C,
+            S=S,
+            g11=g11,
+            g12=g12,
+            g22=g22,
+            fit=fit,
+            residual=residual,
+            cost=np.sum(residual * residual, axis=1),
+        )
+
+    def step(self, projection, lam):
+        """Return the Levenberg-Marquardt step from the frequencies of
+        ``projection``.
+
+        The Jacobian is the one of the variable projection functional with
+        Kaufman's approximation: the derivatives of the model with respect to
+        the frequencies at fixed a and b, projected on the orthogonal
+        complement of the linear basis.
+        """
+        p = projection
+        # Derivatives of the model (at fixed a, b)
+        d_omega_i = -self.tau * p.fit
+        d_omega_r = self.tau * (p.b[:, None] * p.C - p.a[:, None] * p.S)
+
+        columns = []
+        for derivative in (d_omega_i, d_omega_r):
+            x_c, x_s = solve_2x2(
+                p.g11,
+                p.g12,
+                p.g22,
+                np.sum(p.C * derivative, axis=1),
+                np.sum(p.S * derivative, axis=1),
+            )
+            # Jacobian of the residual
+            columns.append(x_c[:, None] * p.C + x_s[:, None] * p.S - derivative)
+        J_i, J_r = columns
+
+        h11 = np.sum(J_i * J_i, axis=1)
+        h12 = np.sum(J_i * J_r, axis=1)
+        h22 = np.sum(J_r * J_r, axis=1)
+        g1 = np.sum(J_i * p.residual, axis=1)
+        g2 = np.sum(J_r * p.residual, axis=1)
+
+        return solve_2x2(h11 * (1 + lam), h12, h22 * (1 + lam), -g1, -g2)
+
+
+def _fit_chunk(t, y, t0, omega_i, omega_r, max_iterations, tolerance):
+    """Fit all the start times ``t0`` at the same time, see
+    :py:func:`fit_start_times`.
+
+    Only the fits that are still running are computed at each iteration.
+    The projection of the trial step is kept for the fits that accept it,
+    so it is computed once per iteration.
+    """
+    windows = _Windows(t, y, t0)
+    num_fits = len(t0)
+    # At the start time tau = 0, so the model is a
+    start_index = np.argmax(windows.mask, axis=1)
+    signal_norm = np.sum(windows.y * windows.y, axis=1)
+    num_points = np.sum(windows.mask, axis=1).astype(int)
+
+    omega_i = np.full(num_fits, omega_i, dtype=float)
+    omega_r = np.full(num_fits, omega_r, dtype=float)
+    lam = np.full(num_fits, 1e-3)
+    converged = np.zeros(num_fits, dtype=bool)
+    iterations = np.zeros(num_fits, dtype=int)
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        projection = windows.project(omega_i, omega_r)
+
+        # Results at the current frequencies, updated when a step is accepted
+        a = projection.a.copy()
+        b = projection.b.copy()
+        cost = projection.cost.copy()
+        start_residual = np.abs(
+            projection.residual[np.arange(num_fits), start_index]
+        )
+
+        # Indices of the fits that are still running, windows and projection
+        # are restricted to them
+        active = np.arange(num_fits)
+        for _ in range(max_iterations):
+            if len(active) == 0:
+                break
+            iterations[active] += 1
+
+            delta_i, delta_r = windows.step(projection, lam[active])
+            new_omega_i = omega_i[active] + delta_i
+            new_omega_r = omega_r[active] + delta_r
+            trial = windows.project(new_omega_i, new_omega_r)
+
+            accepted = np.isfinite(trial.cost) & (trial.cost <= projection.cost)
+            # Converged if the cost does not change (it may be zero, if the
+            # data is an exact damped sinusoid)
+            small_change = accepted & (
+                np.abs(projection.cost - trial.cost)
+                <= tolerance * projection.cost
+            )
+            projection.update(trial, accepted)
+
+            rows = active[accepted]
+            omega_i[rows] = new_omega_i[accepted]
+            omega_r[rows] = new_omega_r[accepted]
+            a[rows] = trial.a[accepted]
+            b[rows] = trial.b[accepted]
+            cost[rows] = trial.cost[accepted]
+            start_residual[rows] = np.abs(
+                trial.residual[accepted, start_index[rows]]
+            )
+            lam[active] = np.where(accepted, lam[active] / 3, lam[active] * 2)
+
+            # Also converged if the step is tiny
+            small_step = np.hypot(delta_i, delta_r) <= tolerance * np.hypot(
+                omega_i[active], omega_r[active]
+            )
+            done = small_step | small_change
+            converged[active[done]] = True
+            # No step reduces the cost anymore
+            done |= lam[active] > 1e16
+
+            if np.any(done):
+                running = ~done
+                active = active[running]
+                windows = windows.take(running)
+                projection = projection.take(running)
+
+    return {
+        "t0": t0,
+        "omega_i": omega_i,
+        "omega_r": omega_r,
+        "amplitude": np.hypot(a, b),
+        "phase": np.arctan2(b, a),
+        "residual": cost,
+        "mismatch": cost / signal_norm,
+        "start_residual": start_residual,
+        "num_points": num_points,
+        "iterations": iterations,
+        "converged": converged & np.isfinite(cost),
+    }
+
+
+def fit_start_times(
+    t,
+    y,
+    t0_min,
+    t0_max,
+    t_end=None,
+    omega_i=DEFAULT_OMEGA_I,
+    omega_r=None,
+    min_points=MIN_POINTS,
+    max_iterations=100,
+    tolerance=1e-10,
+):
+    """Fit a damped sinusoid to ``y`` starting from each sample time between
+    ``t0_min`` and ``t0_max``.
+
+    The model is the one of :py:func:`qnm_model`. Instead of one full
+    nonlinear fit for each start time, as in multipole_fit.jl, the amplitude
+    and the phase are solved in closed form (variable projection), and the
+    frequencies of all the start times are fitted together with a
+    Levenberg-Marquardt iteration with analytic Jacobian, vectorized over the
+    start times.
+
+    :param t: Times, sorted.
+    :type t: 1D NumPy array
+    :param y: Data (real).
+    :type y: 1D NumPy array
+    :param t0_min: First start time to consider.
+    :type t0_min: float
+    :param t0_max: Last start time to consider.
+    :type t0_max: float
+    :param t_end: End of the fit windows (default: last time).
+    :type t_end: float or None
+    :param omega_i: Initial guess for the damping rate.
+    :type omega_i: float
+    :param omega_r: Initial guess for the angular frequency (default: peak
+                    of the periodogram of the longest window).
+    :type omega_r: float or None
+    :param min_points: Minimum number of points in a fit window, at least
+                       :py:data:`MIN_POINTS`.
+    :type min_points: int
+    :param max_iterations: Maximum number of iterations.
+    :type max_iterations: int
+    :param tolerance: Relative change in the cost or in the frequencies
+                      below which the fits are converged.
+    :type tolerance: float
+
+    :returns: One array for each of the :py:data:`FIT_FIELDS`, with one
+              element per start time.
+    :rtype: dict
+    """
+    if min_points < MIN_POINTS:
+        raise ValueError(f"A fit window needs at least {MIN_POINTS} points")
+
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    if t_end is not None:
+        y = y[t <= t_end]
+        t = t[t <= t_end]
+
+    first = np.searchsorted(t, t0_min, side="left")
+    last = min(
+        np.searchsorted(t, t0_max, side="right"),
+        len(t) - min_points + 1,
+    )
+    if last <= first:
+        raise ValueError("No start time has enough points to be fitted")
+
+    # The samples before the first start time are never used
+    t, y = t[first:], y[first:]
+    t0 = t[: last - first]
+
+    if omega_r is None:
+        omega_r = guess_omega_r(t, y)
+        logger.debug(f"Initial guess for omega_r: {omega_r}")
+
+    chunk_size = max(1, CHUNK_ELEMENTS // len(t))
+    chunks = []
+    for start in range(0, len(t0), chunk_size):
+        logger.debug(
+            f"Fitting start times {start} to"
+            f" {min(start + chunk_size, len(t0))} of {len(t0)}"
+        )
+        # Samples before the first start time of the chunk are never used
+        chunks.append(
+            _fit_chunk(
+                t[start:],
+                y[start:],
+                t0[start : start + chunk_size],
+                omega_i,
+                omega_r,
+                max_iterations,
+                tolerance,
+            )
+        )
+
+    return {
+        field: np.concatenate([chunk[field] for chunk in chunks])
+        for field in FIT_FIELDS
+    }
+
+
+def best_fit(fits, criterion="mismatch"):
+    """Return the index of the best of the converged ``fits``.
+
+    With ``criterion="mismatch"``, it is the one with the smallest residual
+    relative to the norm of the data in the window. With
+    ``criterion="start"``, it is the one where the model is closest to the
+    data at the start time, as in multipole_fit.jl.
+    """
+    if criterion not in ("mismatch", "start"):
+        raise ValueError(f"Unknown criterion {criterion}")
+
+    field = "mismatch" if criterion == "mismatch" else "start_residual"
+    values = np.where(fits["converged"], fits[field], np.inf)
+    values = np.where(np.isnan(values), np.inf, values)
+    if not np.any(np.isfinite(values)):
+        raise ValueError("None of the fits converged")
+    return int(np.argmin(values))
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+import json
+import logging
+import sys
+
+from docopt import docopt
+
+import multipole_io
+import qnm
+
+doc=f"""Fit a quasi-normal mode to a multipole saved by save_multipole.py.
+
+The model is A exp(-omega_i (t - t0)) cos(omega_r (t - t0) - phi), fitted
+between t0 and the end time for every start time t0 of the data between
+<t0_min> and <t0_max>. The best start time is printed as JSON, together with
+its fit.
+
+Usage:
+  qnm_fit.py <file> <t0_min> <t0_max> [--radius=<r>] [--l=<l>] [--m=<m>] [--imag] [--tend=<value>] [--omega-i=<value>] [--omega-r=<value>] [--criterion=<name>] [--min-points=<n>] [--max-iterations=<n>] [--all] [--output=<file>] [--verbose]
+  qnm_fit.py (-h | --help)
+  qnm_fit.py --version
+
+Options:
+  -h --help             Show this screen.
+  --version             Show version.
+  --radius=<r>          Extraction radius, to choose the multipole in HDF5
+                        files with all the multipoles.
+  --l=<l>               Multipole number l, for HDF5 files with all the
+                        multipoles.
+  --m=<m>               Multipole number m, for HDF5 files with all the
+                        multipoles.
+  --imag                Fit the imaginary part instead of the real part.
+  --tend=<value>        End of the fit window (default: last time).
+  --omega-i=<value>     Initial guess for the damping rate [default: 0.09].
+  --omega-r=<value>     Initial guess for the angular frequency (default:
+                        peak of the periodogram of the longest window).
+  --criterion=<name>    How to choose the best start time: mismatch (smallest
+                        residual relative to the norm of the data in the
+                        window) or start (smallest residual at the start
+                        time) [default: mismatch].
+  --min-points=<n>      Minimum number of points in a fit window, at least
+                        {qnm.MIN_POINTS} [default: {qnm.MIN_POINTS}].
+  --max-iterations=<n>  Maximum number of Levenberg-Marquardt iterations
+                        [default: 100].
+  --all                 Also output the fits for all the start times.
+  --output=<file>       Write the JSON to a file instead of printing it.
+  --verbose             Print what is happening.
+
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def fit_record(fits, index):
+    """Return the fit ``index`` of ``fits`` as a dictionary of Python
+    scalars."""
+    return {field: fits[field][index].item() for field in qnm.FIT_FIELDS}
+
+
+if __name__ ==  "__main__":
+    arguments = docopt(doc, version="QNM fit 1.0")
+
+    if int(arguments["--min-points"]) < qnm.MIN_POINTS:
+        sys.exit(f"--min-points has to be at least {qnm.MIN_POINTS}")
+
+    if arguments["--verbose"]:
+        logging.basicConfig(format="%(asctime)s - %(message)s")
+        logger.setLevel(logging.DEBUG)
+        qnm.logger.setLevel(logging.DEBUG)
+        multipole_io.logger.setLevel(logging.DEBUG)
+
+    multipole = multipole_io.load_multipole(
+        arguments["<file>"],
+        radius=arguments["--radius"],
+        mult_l=arguments["--l"],
+        mult_m=arguments["--m"],
+    )
+    component = "Im" if arguments["--imag"] else "Re"
+    t = multipole[:, 0]
+    y = multipole[:, multipole_io.COLUMNS.index(component)]
+
+    fits = qnm.fit_start_times(
+        t,
+        y,
+        float(arguments["<t0_min>"]),
+        float(arguments["<t0_max>"]),
+        t_end=None if arguments["--tend"] is None else float(arguments["--tend"]),
+        omega_i=float(arguments["--omega-i"]),
+        omega_r=(
+            None
+            if arguments["--omega-r"] is None
+            else float(arguments["--omega-r"])
+        ),
+        min_points=int(arguments["--min-points"]),
+        max_iterations=int(arguments["--max-iterations"]),
+    )
+    logger.debug(
+        f"{int(fits['converged'].sum())} of {len(fits['t0'])} fits converged"
+    )
+
+    best = qnm.best_fit(fits, arguments["--criterion"])
+
+    result = {
+        "file": arguments["<file>"],
+        "component": component,
+        "criterion": arguments["--criterion"],
+        "best": fit_record(fits, best),
+    }
+    if arguments["--all"]:
+        result["fits"] = [fit_record(fits, index) for index in range(len(fits["t0"]))]
+
+    if arguments["--output"] is None:
+        print(json.dumps(result, indent=2))
+    else:
+        with open(arguments["--output"], "w") as output_file:
+            json.dump(result, output_file, indent=2)
@@ -21,14 +21,35 @@ import logging
 from datetime import datetime
 
 from kuibit import argparse_helper as kah
-from kuibit.simdir import SimDir
 
 import numpy as np
 
+import multipole_io
+import simdir_cache
+
+
+def all_multipoles(reader):
+    """Yield radius, l, m, and timeseries of all the multipoles in reader."""
+    for radius in reader.radii:
+        detector = reader[radius]
+        for mult_l, mult_m in sorted(detector.available_lm):
+            yield radius, mult_l, mult_m, detector[mult_l, mult_m]
+
+
 if __name__ == "__main__":
     desc = f"""\
 {kah.get_program_name()} Saves the multipolar decomposition of the Klein-Gordon
-Scalar field as measured by a given radius and at a given l and m."""
+Scalar field as measured by a given radius and at a given l and m.
+
+By default, the multipole is saved as an ASCII file with the current date in
+the name. With --format npy or h5, it is saved as a binary file with columns
+t, Re, Im, named after the hash of its content, so that the same data always
+has the same file name. HDF5 files also contain name, radius, l, and m as
+attributes.
+
+With --all, all the radii and multipoles are saved in a single HDF5 file,
+with one dataset for each radius and (l, m), named after the hash of its
+content."""
 
     parser = kah.init_argparse(desc)
 
@@ -42,7 +63,6 @@ Scalar field as measured by a given radius and at a given l and m."""
     parser.add_argument(
         "--radius",
         type=float,
-        required=True,
         help="Radius of the multipole extraction."
     )
 
@@ -58,9 +78,28 @@ Scalar field as measured by a given radius and at a given l and m."""
         default=0,
         help="Multipole number m."
     )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Save all the radii and multipoles in a single HDF5 file."
+    )
+    parser.add_argument(
+        "--format",
+        choices=["ascii", "npy", "h5"],
+        help="Format of the output file (default: ascii, h5 with --all)"
+    )
 
     args = kah.get_args(parser)
 
+    if not args.all and args.radius is None:
+        parser.error("--radius is required (unless --all is given)")
+
+    if args.all and args.format not in (None, "h5"):
+        parser.error("--all can only save HDF5 files (--format h5)")
+
+    if args.format is None:
+        args.format = "h5" if args.all else "ascii"
+
     # Parse arguments
 
     logger = logging.getLogger(__name__)
@@ -69,11 +108,15 @@ Scalar field as measured by a given radius and at a given l and m."""
         logging.basicConfig(format="%(asctime)s - %(message)s")
         logger.setLevel(logging.DEBUG)
 
-    filename = f"{args.name}_{args.mult_l}{args.mult_m}_r{args.radius}_" + datetime.now().strftime("%d_%m_%Y_%H:%M:%S") + ".ascii"
-    
-    logger.debug(f"Using file name {filename}")
+    if not args.all and args.format == "ascii":
+        filename = f"{args.name}_{args.mult_l}{args.mult_m}_r{args.radius}_" + datetime.now().strftime("%d_%m_%Y_%H:%M:%S") + ".ascii"
+        logger.debug(f"Using file name {filename}")
 
-    sim = SimDir(args.datadir, ignore_symlinks=args.ignore_symlinks)
+    sim = simdir_cache.load_simdir(
+        args.datadir,
+        ignore_symlinks=args.ignore_symlinks,
+        pickle_file=args.pickle_file,
+    )
 
     logger.debug("Prepared SimDir")
 
@@ -84,25 +127,41 @@ Scalar field as measured by a given radius and at a given l and m."""
 
     reader = reader_mult[args.name]
 
-    logger.debug(f"Using radius: {args.radius}")
+    if args.all:
+        logger.debug("Saving all the multipoles")
+        filename = multipole_io.save_archive(args.name, all_multipoles(reader))
+        logger.debug(f"Saved {filename}")
+    else:
+        logger.debug(f"Using radius: {args.radius}")
+
+        av_radii = reader.radii
 
-    av_radii = reader.radii
+        if args.radius not in av_radii:
+            logger.debug(f"Available radii {av_radii}")
+            raise ValueError(f"{args.radii} not available")
 
-    if args.radius not in av_radii:
-        logger.debug(f"Available radii {av_radii}")
-        raise ValueError(f"{args.radii} not available")
+        detector = reader[args.radius]
 
-    detector = reader[args.radius]
+        if (args.mult_l, args.mult_m) not in detector.available_lm:
+            logger.debug(f"Available multipoles {detector.available_lm}")
+            raise ValueError(f"Multipole {args.mult_l}, {args.mult_m} not available")
 
-    if (args.mult_l, args.mult_m) not in detector.available_lm:
-        logger.debug(f"Available multipoles {detector.available_lm}")
-        raise ValueError(f"Multipole {args.mult_l}, {args.mult_m} not available")
+        phi = detector[args.mult_l, args.mult_m]
 
-    phi = detector[args.mult_l, args.mult_m]
+        logger.debug("Saving")
 
-    logger.debug("Saving")
+        if args.format == "ascii":
+            phi.save(filename)
+        else:
+            filename = multipole_io.save_multipole(
+                args.name,
+                args.radius,
+                args.mult_l,
+                args.mult_m,
+                phi,
+                args.format,
+            )
+            logger.debug(f"Saved {filename}")
 
-    phi.save(filename)
-        
     logger.debug("DONE")
 
@@ -0,0 +1,122 @@
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Size of the blocks read backwards to find the beginning of a line
+BLOCK_SIZE = 2**16
+
+
+def find_scalar_file(reader, variable):
+    """Return the most recently modified file with ``variable`` among the
+    ones found by kuibit, with the columns of time and data in the file.
+
+    The file and its columns are the ones kuibit uses to read the variable
+    (the header is parsed by kuibit, if it was not already). Only
+    uncompressed files can be followed.
+
+    :param reader: Timeseries with a given reduction (e.g.,
+                   ``sim.timeseries["maximum"]``).
+    :type reader: :py:class:`~.AllScalars`
+    :param variable: Name of the variable.
+    :type variable: str
+
+    :returns: Path, time column, and data column.
+    :rtype: tuple of str, int, int
+    """
+    if variable not in reader:
+        raise ValueError(
+            f"{variable} not available with reduction {reader.reduction_type}"
+        )
+
+    # There is one file for each folder (e.g., output-0000, output-0001)
+    scalar_file = max(
+        reader._vars_readers[variable].values(),
+        key=lambda one_scalar: os.path.getmtime(one_scalar.path),
+    )
+    path = scalar_file.path
+
+    if scalar_file._compression_method is not None:
+        raise ValueError(f"{path} is compressed, it cannot be followed")
+
+    if not scalar_file._was_header_scanned:
+        scalar_file._scan_header()
+    if variable not in scalar_file:
+        raise ValueError(f"{variable} not found in the header of {path}")
+
+    logger.debug(f"Following {path}")
+    return path, scalar_file._time_column, scalar_file._vars_columns[variable]
+
+
+def line_start(path, offset):
+    """Return the position of the beginning of the line that contains the
+    byte ``offset`` of the file ``path`` (``offset`` if it is the beginning of
+    a line)."""
+    with open(path, "rb") as file_:
+        end = offset
+        while end > 0:
+            start = max(0, end - BLOCK_SIZE)
+            file_.seek(start)
+            block = file_.read(end - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+class AsciiFollower:
+    """Read the rows appended to a CarpetIOASCII file.
+
+    The file is kept open, and each call to :py:meth:`read` parses only the
+    complete lines written since the previous call, starting from byte
+    ``offset``. Incomplete lines (the simulation may be writing) are read
+    again the next time. If the file becomes shorter (it was overwritten), it
+    is read from the beginning.
+
+    :param path: Path of the file.
+    :type path: str
+    :param time_column: Column with the time.
+    :type time_column: int
+    :param data_column: Column with the data.
+    :type data_column: int
+    :param offset: Position from which to start reading (it has to be the
+                   beginning of a line, see :py:func:`line_start`).
+    :type offset: int
+    """
+
+    def __init__(self, path, time_column, data_column, offset=0):
+        self.path = path
+        self.columns = (time_column, data_column)
+        self.file = open(path, "rb")
+        self.file.seek(offset)
+        self.offset = offset
+
+    def close(self):
+        self.file.close()
+
+    def read(self):
+        """Return time and data of the new complete rows."""
+        if os.fstat(self.file.fileno()).st_size < self.offset:
+            logger.debug(f"{self.path} was truncated, reading from the beginning")
+            self.offset = 0
+
+        self.file.seek(self.offset)
+        new_bytes = self.file.read()
+
+        # Only complete lines
+        end = new_bytes.rfind(b"\n") + 1
+        self.offset += end
+
+        lines = [
+            line
+            for line in new_bytes[:end].decode().splitlines()
+            if line.strip() and not line.startswith("#")
+        ]
+        if not lines:
+            return np.zeros(0), np.zeros(0)
+
+        data = np.loadtxt(lines, usecols=self.columns, ndmin=2)
+        return data[:, 0], data[:, 1]
@@ -0,0 +1,283 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+
+import kuibit
+from kuibit.simdir import SimDir, load_SimDir
+
+logger = logging.getLogger(__name__)
+
+# Readers of SimDir that are built the first time they are used. They are
+# saved in the cache, so that the files are scanned only once.
+READERS = (
+    "timeseries",
+    "multipoles",
+    "gravitationalwaves",
+    "electromagneticwaves",
+    "gridfunctions",
+    "horizons",
+    "timers",
+    "twopunctures",
+)
+
+
+def cache_dir():
+    """Return the directory where the SimDirs are cached."""
+    base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "kuibit-simdir")
+
+
+def normalize_path(path):
+    """Return the absolute version of ``path``, as SimDir does."""
+    return os.path.abspath(os.path.expanduser(path))
+
+
+def default_cache_path(datadir, ignore_symlinks):
+    """Return the path of the cached SimDir for ``datadir``."""
+    key = repr((os.path.realpath(normalize_path(datadir)), bool(ignore_symlinks)))
+    return os.path.join(
+        cache_dir(), hashlib.sha1(key.encode()).hexdigest() + ".pickle"
+    )
+
+
+def cache_path(datadir, ignore_symlinks, pickle_file=None):
+    """Return where the SimDir for ``datadir`` is cached: ``pickle_file``, if
+    given, or a file in the user cache directory."""
+    return pickle_file or default_cache_path(datadir, ignore_symlinks)
+
+
+def signature(sim):
+    """Return what identifies the state of the files indexed by ``sim``.
+
+    The index of the files (what SimDir finds when it scans the folders) is
+    identified by the modification time of all the directories, which
+    changes when files are added or removed, and by the version of kuibit
+    (pickles are not compatible across versions). See
+    :py:func:`index_is_valid`.
+
+    The size and modification time of all the files are also recorded: the
+    readers (e.g., the timeseries) keep the data they read from the files,
+    so they cannot be reused when the simulation writes more data. See
+    :py:func:`files_unchanged`.
+    """
+    files = {}
+    for path in sim.allfiles:
+        stat = os.stat(path)
+        files[path] = [stat.st_size, stat.st_mtime_ns]
+
+    return {
+        "kuibit": kuibit.__version__,
+        "path": sim.path,
+        "ignore_symlinks": sim.ignore_symlinks,
+        "dirs": {path: os.stat(path).st_mtime_ns for path in sim.dirs},
+        "files": files,
+    }
+
+
+def index_is_valid(saved_signature):
+    """Return whether no file was added or removed since ``saved_signature``
+    was taken."""
+    if saved_signature.get("kuibit") != kuibit.__version__:
+        return False
+    try:
+        for path, mtime in saved_signature["dirs"].items():
+            if os.stat(path).st_mtime_ns != mtime:
+                return False
+    except (FileNotFoundError, KeyError, AttributeError, TypeError, ValueError):
+        return False
+    return True
+
+
+def files_unchanged(saved_signature):
+    """Return whether no file changed since ``saved_signature`` was taken."""
+    try:
+        for path, (size, mtime) in saved_signature["files"].items():
+            stat = os.stat(path)
+            if stat.st_size != size or stat.st_mtime_ns != mtime:
+                return False
+    except (FileNotFoundError, KeyError, AttributeError, TypeError, ValueError):
+        return False
+    return True
+
+
+def matches(saved_signature, datadir, ignore_symlinks):
+    """Return whether ``saved_signature`` is for ``datadir`` and no file was
+    added or removed since it was taken."""
+    saved_path = saved_signature.get("path")
+    if saved_path is None or normalize_path(saved_path) != normalize_path(datadir):
+        return False
+    if saved_signature.get("ignore_symlinks") != ignore_symlinks:
+        return False
+    return index_is_valid(saved_signature)
+
+
+def reset_readers(sim):
+    """Drop the readers built in ``sim``, they are built again when used."""
+    for reader in READERS:
+        setattr(sim, f"_SimDir__{reader}", None)
+
+
+def initialized_readers(sim):
+    """Return the names of the readers that have been built in ``sim``."""
+    return {
+        reader
+        for reader in READERS
+        if getattr(sim, f"_SimDir__{reader}", None) is not None
+    }
+
+
+def drop_grid_data(sim):
+    """Remove the data that the grid function readers of ``sim`` read, so
+    that only the index of the files and the headers are cached.
+
+    The HDF5 and openPMD readers keep the components they read until their
+    cache is cleared. The ASCII readers parse whole files at once and have
+    no cache to clear, so they are dropped and built again when used.
+    """
+    gridfunctions = getattr(sim, "_SimDir__gridfunctions", None)
+    if gridfunctions is None:
+        return
+    for all_gridfunctions in gridfunctions._all_griddata.values():
+        for variable, reader in list(all_gridfunctions._vars.items()):
+            if hasattr(reader, "clear_cache"):
+                reader.clear_cache()
+            else:
+                del all_gridfunctions._vars[variable]
+
+
+def read_cache(path, datadir, ignore_symlinks):
+    """Return the SimDir cached in ``path`` and its signature if its index is
+    still valid (see :py:func:`matches`), otherwise None."""
+    signature_path = path + ".signature"
+    if not (os.path.exists(path) and os.path.exists(signature_path)):
+        return None
+
+    try:
+        with open(signature_path) as file_:
+            saved_signature = json.load(file_)
+    except (OSError, ValueError):
+        return None
+
+    if not matches(saved_signature, datadir, ignore_symlinks):
+        logger.debug(f"{path} is out of date")
+        return None
+
+    try:
+        return load_SimDir(path), saved_signature
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, RuntimeError):
+        logger.debug(f"Could not read {path}")
+        return None
+
+
+def write_cache(sim, path, sim_signature):
+    """Save ``sim`` to ``path`` with its signature.
+
+    The data read by the grid function readers is removed from ``sim`` first
+    (see :py:func:`drop_grid_data`), otherwise the cache grows as large as
+    the data that was read.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    signature_path = path + ".signature"
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # The old signature has to go first, it does not describe the new
+        # pickle
+        if os.path.exists(signature_path):
+            os.remove(signature_path)
+
+        drop_grid_data(sim)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file_:
+            pickle.dump(sim, file_, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file_:
+            json.dump(sim_signature, file_)
+        os.replace(tmp_path, signature_path)
+    except OSError as exce:
+        # We can live without the cache
+        logger.debug(f"Could not save SimDir to {path}: {exce}")
+        return
+
+    logger.debug(f"Saved SimDir to {path}")
+
+
+def load_simdir(datadir, ignore_symlinks=True, pickle_file=None, save_at_exit=True):
+    """Return a SimDir for ``datadir``, reading it from the cache if possible.
+
+    The SimDir is cached as a pickle in ``pickle_file`` or, if that is None,
+    in the user cache directory (see :py:func:`cache_dir`). The cache is
+    used only if the modification times of the directories did not change
+    since it was saved (no file was added or removed), otherwise the folders
+    are scanned again. If only the content of some files changed (e.g., the
+    simulation is running), the index of the files is reused, but the
+    readers are built again, because they keep the data they read (see
+    :py:func:`signature`).
+
+    A ``pickle_file`` saved without signature (e.g., by SimDir itself) is
+    used as it is, and it is never overwritten.
+
+    If ``save_at_exit``, the SimDir is saved to the cache when the program
+    ends, if it was scanned again or if new readers (e.g., the timeseries)
+    were used, so that the work done to index the files is reused the next
+    time.
+
+    :param datadir: Directory with the simulation.
+    :type datadir: str
+    :param ignore_symlinks: Whether to ignore symbolic links.
+    :type ignore_symlinks: bool
+    :param pickle_file: Where to cache the SimDir.
+    :type pickle_file: str or None
+    :param save_at_exit: Whether to update the cache when the program ends.
+    :type save_at_exit: bool
+
+    :returns: SimDir
+    :rtype: :py:class:`~.SimDir`
+    """
+    path = cache_path(datadir, ignore_symlinks, pickle_file)
+
+    if (
+        pickle_file is not None
+        and os.path.exists(pickle_file)
+        and not os.path.exists(pickle_file + ".signature")
+    ):
+        logger.warning(
+            f"{pickle_file} was not saved by this cache, using it as it is"
+            " (it may be out of date and it will not be updated)"
+        )
+        return load_SimDir(pickle_file)
+
+    cached = read_cache(path, datadir, ignore_symlinks)
+    if cached is None:
+        logger.debug("Scanning the simulation folders")
+        sim = SimDir(datadir, ignore_symlinks=ignore_symlinks)
+        # The signature is taken now, files that change while the program is
+        # running will invalidate the cache
+        sim_signature = signature(sim)
+        readers_at_load = None
+    elif not files_unchanged(cached[1]):
+        logger.debug(f"Read SimDir from {path}, files changed since")
+        sim = cached[0]
+        reset_readers(sim)
+        sim_signature = signature(sim)
+        readers_at_load = None
+    else:
+        logger.debug(f"Read SimDir from {path}")
+        sim, sim_signature = cached
+        readers_at_load = initialized_readers(sim)
+
+    if save_at_exit:
+
+        def save_if_needed():
+            if readers_at_load is None or initialized_readers(sim) - readers_at_load:
+                write_cache(sim, path, sim_signature)
+
+        atexit.register(save_if_needed)
+
+    return sim
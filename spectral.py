@@ -0,0 +1,234 @@
+import numpy as np
+import scipy.fft
+from scipy import signal
+
+
+def get_window(name, length, alpha=0.0):
+    """Return the periodic window ``name`` with ``length`` points, as used
+    for spectral estimation (e.g., by ``scipy.signal.welch``).
+
+    ``name`` is any window known to ``scipy.signal.get_window``. For the Tukey
+    window, ``alpha`` is its shape parameter.
+    """
+    if name == "tukey":
+        return signal.windows.tukey(length, alpha=alpha, sym=False)
+    return signal.get_window(name, length, fftbins=True)
+
+
+def spectrum(y, dt, W, one_sided=False, workers=None):
+    """Return the frequencies and the Fourier transform of ``y * W``.
+
+    If ``one_sided``, only the non-negative frequencies are computed with a
+    real FFT, which takes half the time and memory. They are the same bins
+    as the non-negative frequencies of the full spectrum, so the Nyquist
+    frequency is not included for even lengths (``fftfreq`` makes it
+    negative). Otherwise, the full spectrum is returned sorted by frequency.
+    The transform is along the last axis, so ``y`` can be a stack of signals
+    with the same length.
+
+    :param y: Signal(s), sampled with uniform spacing ``dt``.
+    :type y: NumPy array
+    :param dt: Sampling interval.
+    :type dt: float
+    :param W: Window, with the same length as the last axis of ``y``.
+    :type W: 1D NumPy array
+    :param one_sided: Whether to compute only the non-negative frequencies.
+    :type one_sided: bool
+    :param workers: Number of threads used by ``scipy.fft`` (-1 for all the
+                    available cores).
+    :type workers: int or None
+
+    :returns: Frequencies and transform.
+    :rtype: tuple of NumPy arrays
+    """
+    n = np.shape(y)[-1]
+    if one_sided:
+        yBar = scipy.fft.rfft(y * W, workers=workers)
+        f = scipy.fft.rfftfreq(n, dt)
+        num_non_negative = (n + 1) // 2
+        return f[:num_non_negative], yBar[..., :num_non_negative]
+
+    yBar = scipy.fft.fft(y * W, workers=workers)
+    f = scipy.fft.fftfreq(n, dt)
+    return scipy.fft.fftshift(f), scipy.fft.fftshift(yBar, axes=-1)
+
+
+def fold_one_sided(PSD):
+    """Turn the non-negative frequencies of a two-sided PSD of a real signal
+    into the one-sided PSD (in place).
+
+    All the bins are doubled to account for the negative frequencies, as
+    psd_plot has always done with --positive.
+    """
+    PSD *= 2
+    return PSD
+
+
+def periodogram(y, dt, W, one_sided=False, workers=None):
+    """Return the frequencies and the power spectral density of ``y``
+    windowed with ``W``.
+
+    The PSD is normalized as ``dt / sum(W**2) * |FFT(y * W)|**2``. See
+    :py:func:`spectrum` for the other arguments.
+    """
+    f, yBar = spectrum(y, dt, W, one_sided=one_sided, workers=workers)
+
+    PSD = np.abs(yBar)**2
+    PSD *= dt / np.sum(W**2)
+
+    if one_sided:
+        fold_one_sided(PSD)
+
+    return f, PSD
+
+
+def welch_psd(
+    y,
+    dt,
+    segment_length,
+    overlap=None,
+    window="tukey",
+    alpha=0.0,
+    one_sided=False,
+    workers=None,
+):
+    """Return the power spectral density of ``y`` averaged over overlapping
+    segments (Welch's method).
+
+    The segments are read from ``y`` one at the time, so if ``y`` is
+    memory-mapped, only one segment is in memory. The normalization is the
+    same as for :py:func:`periodogram`, so the two can be compared directly.
+
+    :param y: Signal, sampled with uniform spacing ``dt``.
+    :type y: 1D NumPy array
+    :param dt: Sampling interval.
+    :type dt: float
+    :param segment_length: Number of points in each segment. It is reduced
+                           to the length of ``y`` if longer.
+    :type segment_length: int
+    :param overlap: Number of points shared by consecutive segments. If None,
+                    half segment.
+    :type overlap: int or None
+    :param window: Name of the window applied to each segment.
+    :type window: str
+    :param alpha: Shape parameter of the Tukey window.
+    :type alpha: float
+    :param one_sided: Whether to compute only the non-negative frequencies.
+    :type one_sided: bool
+    :param workers: Number of threads used by ``scipy.fft``.
+    :type workers: int or None
+
+    :returns: Frequencies and PSD, sorted by frequency.
+    :rtype: tuple of 1D NumPy arrays
+    """
+    segment_length = min(segment_length, len(y))
+    if overlap is None:
+        overlap = segment_length // 2
+    step = segment_length - overlap
+    if step <= 0:
+        raise ValueError("The overlap has to be smaller than the segment")
+
+    W = get_window(window, segment_length, alpha)
+
+    PSD = None
+    num_segments = 0
+    for start in range(0, len(y) - segment_length + 1, step):
+        segment = np.asarray(y[start:start + segment_length], dtype=float)
+        f, segment_PSD = periodogram(
+            segment, dt, W, one_sided=one_sided, workers=workers
+        )
+        if PSD is None:
+            PSD = segment_PSD
+        else:
+            PSD += segment_PSD
+        num_segments += 1
+
+    PSD /= num_segments
+
+    return f, PSD
+
+
+def find_peaks(f, S, num_peaks=1, interpolation="quadratic"):
+    """Return the ``num_peaks`` highest local maxima of the spectra ``S``.
+
+    The position and the height of each peak are refined by fitting a
+    parabola through the maximum and its two neighbors. With
+    ``interpolation="gaussian"``, the parabola is fitted to the logarithm of
+    the spectrum, which is exact for Gaussian peaks (e.g., windowed
+    sinusoids). Peaks at the first or last bin are not interpolated.
+
+    :param f: Frequencies, uniformly spaced.
+    :type f: 1D NumPy array
+    :param S: Spectrum (or spectra, one per row).
+    :type S: 1D or 2D NumPy array
+    :param num_peaks: Number of peaks to return.
+    :type num_peaks: int
+    :param interpolation: quadratic, gaussian, or none.
+    :type interpolation: str
+
+    :returns: Frequencies, heights, and bin indices of the peaks, sorted by
+              decreasing height, with shape ``S.shape[:-1] + (num_peaks,)``.
+              If there are fewer peaks, the missing ones are NaN (index -1).
+    :rtype: tuple of NumPy arrays
+    """
+    if interpolation not in ("quadratic", "gaussian", "none"):
+        raise ValueError(f"Unknown interpolation {interpolation}")
+
+    S = np.asarray(S, dtype=float)
+    n = S.shape[-1]
+    num_peaks = min(num_peaks, n)
+
+    # Local maxima, the first and last bins only have one neighbor
+    padded = np.pad(
+        S, [(0, 0)] * (S.ndim - 1) + [(1, 1)], constant_values=-np.inf
+    )
+    is_peak = (S > padded[..., :-2]) & (S >= padded[..., 2:])
+    candidates = np.where(is_peak, S, -np.inf)
+
+    # Highest num_peaks candidates, sorted by decreasing height
+    indices = np.argpartition(-candidates, num_peaks - 1, axis=-1)[..., :num_peaks]
+    order = np.argsort(-np.take_along_axis(candidates, indices, axis=-1), axis=-1)
+    indices = np.take_along_axis(indices, order, axis=-1)
+    found = np.isfinite(np.take_along_axis(candidates, indices, axis=-1))
+
+    # Values around the peaks, clipped at the boundaries
+    left = np.take_along_axis(S, np.maximum(indices - 1, 0), axis=-1)
+    center = np.take_along_axis(S, indices, axis=-1)
+    right = np.take_along_axis(S, np.minimum(indices + 1, n - 1), axis=-1)
+    interior = (indices > 0) & (indices < n - 1)
+
+    if interpolation == "gaussian":
+        # Non-positive values cannot be interpolated in log
+        interior &= (left > 0) & (center > 0) & (right > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            left, center, right = np.log(left), np.log(center), np.log(right)
+
+    offset = np.zeros(indices.shape)
+    height = center.copy()
+    if interpolation != "none":
+        curvature = left - 2 * center + right
+        interior &= curvature < 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            offset = np.where(
+                interior, 0.5 * (left - right) / curvature, 0.0
+            )
+        height = np.where(
+            interior, center - 0.25 * (left - right) * offset, center
+        )
+        if interpolation == "gaussian":
+            height = np.exp(height)
+            # Points that could not be interpolated in log
+            height = np.where(
+                np.isfinite(height),
+                height,
+                np.take_along_axis(S, indices, axis=-1),
+            )
+
+    df = f[1] - f[0]
+    frequencies = f[indices] + offset * df
+
+    frequencies = np.where(found, frequencies, np.nan)
+    height = np.where(found, height, np.nan)
+    indices = np.where(found, indices, -1)
+
+    return frequencies, height, indices
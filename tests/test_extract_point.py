@@ -0,0 +1,56 @@
+import os
+import sys
+
+import h5py
+import numpy as np
+from kuibit.simdir import SimDir
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extract_point  # noqa: E402
+
+
+def write_xy_file(path, iterations):
+    """Write a Carpet-like HDF5 file with ``ADMBASE::alp`` on the xy plane,
+    equal to the iteration everywhere."""
+    with h5py.File(path, "w") as file_:
+        # kuibit reads the ghost zones from the parameters
+        file_.create_dataset(
+            "Parameters and Global Attributes/All Parameters",
+            data=np.frombuffer(
+                b"CarpetIOHDF5::output_ghost_points = no\n", dtype=np.uint8
+            ),
+        )
+        for iteration in iterations:
+            dataset = file_.create_dataset(
+                f"ADMBASE::alp it={iteration} tl=0 rl=0 c=0",
+                data=np.full((9, 9), float(iteration)),
+            )
+            dataset.attrs["delta"] = np.array([0.5, 0.5])
+            dataset.attrs["origin"] = np.array([-2.0, -2.0])
+            dataset.attrs["time"] = 0.25 * iteration
+
+
+def cached_components(gf):
+    return [
+        component
+        for file_reader in gf.alldata.values()
+        for iteration_reader in file_reader.values()
+        for ref_level_reader in iteration_reader.values()
+        for component in ref_level_reader.values()
+        if component is not None
+    ]
+
+
+def test_sample_iterations_clears_cache(tmp_path):
+    iterations = [0, 2, 4]
+    write_xy_file(tmp_path / "alp.xy.h5", iterations)
+    gf = SimDir(str(tmp_path)).gridfunctions["xy"]["alp"]
+    points = [[0.0, 0.0], [0.5, -1.0]]
+
+    rows = extract_point.sample_iterations(gf, iterations, points)
+
+    np.testing.assert_allclose(rows[:, 0], iterations)
+    np.testing.assert_allclose(rows[:, 1], [0.25 * it for it in iterations])
+    np.testing.assert_allclose(rows[:, 2:], [[it, it] for it in iterations])
+    assert cached_components(gf) == []
@@ -0,0 +1,180 @@
+import logging
+import queue
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class VideoWriter:
+    """Encode RGBA frames into the video ``path`` with ffmpeg.
+
+    The frames are sent to ffmpeg as raw pixels through a pipe, so no image
+    file is written. The frames are passed to a separate thread that feeds
+    ffmpeg, so the next frame can be rendered while the previous one is
+    encoded. At most ``queue_size`` frames are kept in memory: if the encoder
+    is slower than the rendering, :py:meth:`write` waits.
+
+    ffmpeg is started at the first frame, when the size of the video is
+    known. Odd sizes are padded to be even, as required by most codecs.
+
+    Use it as a context manager, so that the video is finalized (or ffmpeg is
+    stopped, if there was an error).
+
+    :param path: Output video file (the container is deduced by ffmpeg from
+                 the extension).
+    :type path: str
+    :param fps: Frames per second.
+    :type fps: float
+    :param ffmpeg: ffmpeg executable.
+    :type ffmpeg: str
+    :param codec: Video codec passed to ffmpeg.
+    :type codec: str
+    :param queue_size: Maximum number of frames waiting to be encoded.
+    :type queue_size: int
+    """
+
+    def __init__(self, path, fps, ffmpeg="ffmpeg", codec="libx264", queue_size=8):
+        self.path = path
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self.codec = codec
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.shape = None
+        self.process = None
+        self.stderr = None
+        self.thread = None
+        # Exception raised in the encoding thread
+        self.error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def command(self, width, height):
+        """Return the ffmpeg command line for frames of the given size."""
+        return [
+            self.ffmpeg,
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgba",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            str(self.fps),
+            "-i",
+            "-",
+            "-vf",
+            "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-c:v",
+            self.codec,
+            "-pix_fmt",
+            "yuv420p",
+            self.path,
+        ]
+
+    def start(self, shape):
+        height, width = shape[:2]
+        command = self.command(width, height)
+        logger.debug(f"Starting {' '.join(command)}")
+
+        # ffmpeg errors are collected in a file, a pipe could fill up and
+        # block ffmpeg
+        self.stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stderr=self.stderr
+        )
+        self.shape = shape
+        self.thread = threading.Thread(target=self._encode, daemon=True)
+        self.thread.start()
+
+    def _encode(self):
+        while True:
+            image = self.queue.get()
+            if image is None:
+                break
+            if self.error is not None:
+                # Keep consuming, so that write does not block
+                continue
+            try:
+                self.process.stdin.write(image.tobytes())
+            except OSError as exce:
+                self.error = exce
+
+    def write(self, image):
+        """Add a frame to the video.
+
+        :param image: Pixels of the frame, with shape (height, width, 4).
+        :type image: NumPy array of uint8
+        """
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+
+        if self.process is None:
+            self.start(image.shape)
+        elif image.shape != self.shape:
+            raise ValueError(
+                f"Frame with shape {image.shape}, expected {self.shape}"
+            )
+
+        if self.error is not None:
+            self.abort()
+            raise RuntimeError(f"Could not write to ffmpeg: {self.error}")
+
+        self.queue.put(image)
+
+    def _stop_thread(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def _ffmpeg_output(self):
+        self.stderr.seek(0)
+        return self.stderr.read().decode(errors="replace")
+
+    def close(self):
+        """Wait for all the frames to be encoded and finalize the video."""
+        if self.process is None:
+            logger.debug("No frames to encode")
+            return
+
+        self._stop_thread()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        returncode = self.process.wait()
+        output = self._ffmpeg_output()
+        self.stderr.close()
+        self.process = None
+
+        if returncode != 0 or self.error is not None:
+            raise RuntimeError(f"ffmpeg failed ({returncode}): {output}")
+
+        logger.debug(f"Saved video {self.path}")
+
+    def abort(self):
+        """Stop ffmpeg without finalizing the video."""
+        if self.process is None:
+            return
+
+        # ffmpeg is killed first, so that the thread is not blocked writing
+        self.error = self.error or RuntimeError("Aborted")
+        self.process.kill()
+        self._stop_thread()
+        self.process.wait()
+        self.stderr.close()
+        self.process = None